@@ -3,93 +3,106 @@ This module scrapes all the data with is not scraped by the main scraper.
 And it sets is_archived to True for all the vacancies which are not actual anymore.
 """
 import logging
-from datetime import datetime
 import asyncio
 
 from aiolimiter import AsyncLimiter
-from selectolax.parser import HTMLParser
 from rich import print
 
 from db_operations import MongoConnector
-from html_scraper import get_html
-from models import VacancyRAW
+from html_scraper import get_html, client_registry
+from html_cache import html_cache
+from retry import FetchError
+from automated_browser import browser_pool
+from pipeline import Pipeline, Stage
+from parse_executor import parse_executor
+from parsers import detect_is_archived
+from status_probe import probe_status, probe_stats, ARCHIVED, ACTIVE, NOT_MODIFIED
+
+WORKERS = 50
+PROGRESS_INTERVAL = 30
+# check status with streamed conditional request instead of downloading and parsing the whole page
+PROBE_MODE = True
+
 
 async def get_not_scraped_items(db_manager: MongoConnector):
     """
-    This function gets all the items which are not scraped yet.
+    This function returns a cursor over all the items which are not seen in the current run,
+    with only fields which are needed to check status.
     """
-    # get all the items which are not scraped and not archived
-    items = db_manager.collection.find({"is_actual": False, "is_archived": False})
+    # get all the items which are not seen in the current run and not archived
+    run_id = await db_manager.current_run_id()
+    query = db_manager.not_scraped_query(run_id)
+    total = await db_manager.collection.count_documents(query)
+    items = db_manager.collection.find(query, {"source_id": 1, "url": 1, 
+                                               "probe_etag": 1, "probe_last_modified": 1})
     
-    return [VacancyRAW(**item) async for item in items]
+    return items, total
 
-async def process_batch(batch):
-    """ function to process batch of items """
-    start = datetime.now()
-    await asyncio.gather(*batch)
-    end = datetime.now()
-    print(f"BATCH DONE, time spended - {end - start}")
 
+async def probe_statuses(item: dict, 
+                         db_manager: MongoConnector, 
+                         limiter: AsyncLimiter):
+    """ function to update statuses of items with status probe """
+    result = await probe_status(item["url"], limiter, 
+                                item.get("probe_etag"), item.get("probe_last_modified"))
 
-def detect_is_archived(html):
-    """ function to detect if the vacancy is archived """
-    selectolax = HTMLParser(html)
-    archived_selector = selectolax.css_first("div.vacancy-section > h2")
+    if result.status == ARCHIVED:
+        await db_manager.set_is_archived_true(item["source_id"])
 
-    if archived_selector:
-        
-        if "архив" in archived_selector.text().lower():
-            return True
-        else:
-            return False
+    elif result.status in (ACTIVE, NOT_MODIFIED):
+        await db_manager.set_seen(item["source_id"], {"probe_etag": result.etag, 
+                                                      "probe_last_modified": result.last_modified})
 
-    else:
-        return False
 
-
-async def update_statuses(item: VacancyRAW, 
+async def update_statuses(item: dict, 
                           db_manager: MongoConnector, 
                           limiter: AsyncLimiter):
     """ function to update statuses of items """
-    html = await get_html(item.url, "httpx", limiter)
-    
-    if not html:
-        html = await get_html(item.url, "browser", limiter)
+    if PROBE_MODE:
+        return await probe_statuses(item, db_manager, limiter)
+
+    try:
+        # cached page can be a week old, status must be checked on the fresh one
+        html = await get_html(item["url"], "auto", limiter, page_kind="vacancy", 
+                              raise_not_found=True, use_cache=False)
+
+    except FetchError:
+        # deleted vacancy is never shown again
+        await db_manager.set_is_archived_true(item["source_id"])
+        return None
 
     if not html:
         return None
 
-    is_archived = detect_is_archived(html)
+    is_archived = await parse_executor.is_archived(html)
 
     if is_archived:
-        await db_manager.set_is_archived_true(item.source_id)
+        await db_manager.set_is_archived_true(item["source_id"])
     
     else:
-        await db_manager.set_is_actual_true(item.source_id)
+        await db_manager.set_seen(item["source_id"])
 
 
 async def update_rest_items(db_manager: MongoConnector, limiter: AsyncLimiter):
     """
     This function updates all the items which are not actual anymore.
+    Items are streamed from the cursor into a fixed pool of workers,
+    so only a few of them are kept in memory at once.
     """
     # get all the items which are not actual and not archived
-    items = await get_not_scraped_items(db_manager)
-
-    tasks = []
+    items, total = await get_not_scraped_items(db_manager)
+    logging.info(f"TOTAL TASKS: {total}")
 
-    for item in items:
-        tasks.append(update_statuses(item, db_manager, limiter))
+    async def check_item(item):
+        await update_statuses(item, db_manager, limiter)
 
-    total_tasks = len(tasks)
-    batch_size = 100
-    tasks_left = total_tasks
-    print(f"TOTAL TASKS: {total_tasks}")
+    pipeline = Pipeline([Stage("status check", check_item, workers=WORKERS, queue_size=WORKERS * 2)],
+                        progress_interval=PROGRESS_INTERVAL,
+                        total=total)
+    await pipeline.run(items)
 
-    for i in range(0, total_tasks, batch_size):
-        batch = tasks[i:i+batch_size]
-        await process_batch(batch)
-        tasks_left -= batch_size
-        logging.info(f"TASKS LEFT: {0 if tasks_left <= 0 else tasks_left}")
+    if PROBE_MODE:
+        logging.info(probe_stats.report())
 
  # ===========================================================================   
 
@@ -101,7 +114,26 @@ async def fast_test():
     is_archived = detect_is_archived(html)
     print(is_archived)
 
-if __name__ == "__main__":
+async def main():
     db_manager = MongoConnector()
     limiter = AsyncLimiter(10, 1)
-    asyncio.run(update_rest_items(db_manager, limiter))
\ No newline at end of file
+    await db_manager.ensure_indexes()
+    # recheck items which were not seen in the latest run
+    db_manager.run_id = await db_manager.latest_run_id()
+
+    if db_manager.run_id is None:
+        await db_manager.start_run()
+
+    try:
+        await update_rest_items(db_manager, limiter)
+    
+    finally:
+        await client_registry.close()
+        await browser_pool.close()
+        html_cache.close()
+        parse_executor.shutdown()
+        await db_manager.close_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
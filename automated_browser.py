@@ -1,5 +1,7 @@
+import time
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 import playwright
 import aiolimiter
@@ -7,37 +9,297 @@ from playwright.async_api import async_playwright
 from playwright.async_api._generated import Request, Route
 from undetected_playwright import stealth_async
 from rich import print
-from tools import playwright_proxy_gen
+from tools import playwright_proxy_scheduler
+from response_classifier import FetchedPage
 
 responses = []
 limiter = aiolimiter.AsyncLimiter(10, 1)
 
+# ===================================== BROWSER POOL =====================================
+
+CONTEXTS_PER_BROWSER = 3
+MAX_PAGES_PER_CONTEXT = 50
+# browsers are bound to proxies, least recently used idle browser is closed to launch a new one
+MAX_BROWSERS = 5
+HEALTH_CHECK_INTERVAL = 60
+
+
+def proxy_key(proxy):
+    """ hashable key for playwright proxy dict """
+    if not proxy:
+        return None
+    return (proxy.get("server"), proxy.get("username"))
+
+
+class PageSlot:
+    """ stealth-prepared context with a single page which is reused between requests """
+
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.pages_served = 0
+        self.healthy = True
+
+    def is_usable(self, max_pages):
+        return (self.healthy
+                and not self.page.is_closed()
+                and self.pages_served < max_pages)
+
+    async def close(self):
+        try:
+            await self.context.close()
+        except playwright._impl._errors.Error:
+            pass
+
+
+class PooledBrowser:
+    """ warm chromium bound to one proxy with bounded amount of contexts """
+
+    def __init__(self, playwright_instance, proxy, contexts, max_pages):
+        self.playwright = playwright_instance
+        self.proxy = proxy
+        self.max_pages = max_pages
+        self.browser = None
+        self.slots = asyncio.Queue()
+        self.free_places = asyncio.Semaphore(contexts)
+        self.lock = asyncio.Lock()
+        # requests which use or wait for the browser, managed by BrowserPool
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+    async def ensure_browser(self):
+        async with self.lock:
+            if self.browser and self.browser.is_connected():
+                return self.browser
+
+            if self.browser:
+                logging.warning("Browser for proxy %s is disconnected, relaunching",
+                                (self.proxy or {}).get("server"))
+                await self.drop_slots()
+
+            self.browser = await self.playwright.chromium.launch(headless=True, proxy=self.proxy)
+            return self.browser
+
+    async def new_slot(self):
+        browser = await self.ensure_browser()
+        context = await browser.new_context(ignore_https_errors=True)
+        await stealth_async(context)
+        await context.add_init_script("delete Object.getPrototypeOf(navigator).webdriver")
+        page = await context.new_page()
+        return PageSlot(context, page)
+
+    async def acquire(self):
+        await self.free_places.acquire()
+
+        try:
+            while not self.slots.empty():
+                slot = self.slots.get_nowait()
+
+                if slot.is_usable(self.max_pages) and self.browser.is_connected():
+                    return slot
+
+                # recycle context which served too many pages or failed health check
+                await slot.close()
+
+            return await self.new_slot()
+
+        except BaseException:
+            self.free_places.release()
+            raise
+
+    async def release(self, slot):
+        if slot.is_usable(self.max_pages):
+            self.slots.put_nowait(slot)
+        else:
+            await slot.close()
+
+        self.free_places.release()
+
+    async def health_check(self):
+        """ 
+        check that browser is alive and idle pages still respond.
+        Checked slot takes a free place like acquire() does, so contexts never exceed the limit.
+        Disconnected browser only loses its slots, it is relaunched by the next acquire().
+        """
+        if not self.browser:
+            return True
+
+        if not self.browser.is_connected():
+            await self.drop_slots()
+            return False
+
+        for _ in range(self.slots.qsize()):
+            await self.free_places.acquire()
+
+            if self.slots.empty():
+                self.free_places.release()
+                break
+
+            slot = self.slots.get_nowait()
+            try:
+                await slot.page.evaluate("1")
+            except playwright._impl._errors.Error:
+                slot.healthy = False
+
+            await self.release(slot)
+
+        return True
+
+    async def drop_slots(self):
+        while not self.slots.empty():
+            await self.slots.get_nowait().close()
+
+    async def close(self):
+        await self.drop_slots()
+
+        if self.browser:
+            try:
+                await self.browser.close()
+            except playwright._impl._errors.Error:
+                pass
+            self.browser = None
+
+
+class BrowserPool:
+    """
+    Long-lived pool of warm browsers, one per proxy, up to `max_browsers` at once.
+    Every browser keeps up to `contexts` stealth contexts,
+    each context is recycled after `max_pages` served pages.
+    Idle pages are health checked every `health_check_interval` seconds.
+    """
+
+    def __init__(self, contexts=CONTEXTS_PER_BROWSER, max_pages=MAX_PAGES_PER_CONTEXT,
+                 max_browsers=MAX_BROWSERS, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.contexts = contexts
+        self.max_pages = max_pages
+        self.max_browsers = max_browsers
+        self.health_check_interval = health_check_interval
+        self.manager = None
+        self.playwright = None
+        self.browsers = {}
+        self.lock = asyncio.Lock()
+        self.browsers_changed = asyncio.Condition()
+        self.health_task = None
+
+    async def start(self):
+        async with self.lock:
+            if self.playwright is None:
+                self.manager = async_playwright()
+                self.playwright = await self.manager.start()
+                self.health_task = asyncio.create_task(self.check_periodically())
+
+        return self
+
+    async def get_browser(self, proxy):
+        """ browser is reserved for the caller, it must be given back with return_browser() """
+        await self.start()
+        key = proxy_key(proxy)
+
+        async with self.browsers_changed:
+            while key not in self.browsers and len(self.browsers) >= self.max_browsers:
+                idle = [other for other, browser in self.browsers.items() if browser.in_use == 0]
+
+                if idle:
+                    oldest = min(idle, key=lambda other: self.browsers[other].last_used)
+                    await self.browsers.pop(oldest).close()
+                else:
+                    await self.browsers_changed.wait()
+
+            if key not in self.browsers:
+                self.browsers[key] = PooledBrowser(self.playwright, proxy,
+                                                   self.contexts, self.max_pages)
+
+            browser = self.browsers[key]
+            browser.in_use += 1
+
+        return browser
+
+    async def return_browser(self, browser):
+        async with self.browsers_changed:
+            browser.in_use -= 1
+            browser.last_used = time.monotonic()
+            self.browsers_changed.notify_all()
+
+    @asynccontextmanager
+    async def page(self, proxy):
+        browser = await self.get_browser(proxy)
+
+        try:
+            slot = await browser.acquire()
+
+            try:
+                yield slot.page
+                slot.pages_served += 1
+
+            except BaseException:
+                slot.healthy = False
+                raise
+
+            finally:
+                await browser.release(slot)
+
+        finally:
+            await self.return_browser(browser)
+
+    async def health_check(self):
+        results = {}
+        for key, browser in list(self.browsers.items()):
+            results[key] = await browser.health_check()
+
+        return results
+
+    async def check_periodically(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+
+            try:
+                results = await self.health_check()
+                failed = [key for key, healthy in results.items() if not healthy]
+
+                if failed:
+                    logging.warning("Browsers for %s are disconnected, they will be relaunched", failed)
+
+            except Exception as exc:
+                logging.error("Browser health check failed: %s", exc)
+
+    async def close(self):
+        if self.health_task:
+            self.health_task.cancel()
+            self.health_task = None
+
+        for browser in self.browsers.values():
+            await browser.close()
+        self.browsers = {}
+
+        if self.manager:
+            await self.manager.__aexit__(None, None, None)
+            self.manager = None
+            self.playwright = None
+
+        logging.info("Browser pool closed")
+
+
+browser_pool = BrowserPool()
+
 # ===================================== HTML RENDERER =====================================
 
-async def scrape_html(url, semaphore):
-    global responses
-    items = []
-    proxy = next(playwright_proxy_gen) 
+async def scrape_html(url, semaphore, proxy=None):
+    if proxy is None:
+        proxy = playwright_proxy_scheduler.acquire()
 
     async with semaphore:
-        async with async_playwright() as p:
-            # first set browser
-            browser = await p.chromium.launch(headless=True, proxy=proxy)
-            context = await browser.new_context(ignore_https_errors=True)
-            await stealth_async(context)
-            page = await context.new_page()
-            await page.add_init_script("delete Object.getPrototypeOf(navigator).webdriver")
-            
-            
-            await page.goto(url, timeout=30000)
+        async with browser_pool.page(proxy) as page:
+            response = await page.goto(url, timeout=30000)
             await page.wait_for_load_state("load")
             
             html = await page.inner_html("html")
 
             logging.info("Succesfully rendered and scraped item's page")
-            await browser.close()
 
-            return html
+            if response is None:
+                return FetchedPage(html)
+
+            return FetchedPage(html, response.status, response.headers)
 
 
 
@@ -70,7 +332,7 @@ async def try_request(url, semaphore):
             print("Starting browser")
             user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
             # first set browser
-            proxy = next(playwright_proxy_gen)  # get proxy
+            proxy = playwright_proxy_scheduler.acquire()  # get proxy
      
             browser = await p.chromium.launch(headless=True, proxy=proxy)
             
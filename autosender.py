@@ -142,6 +142,7 @@ async def grab_items(search_string, db_manager):
 async def main():
     db_manager = MongoConnector()
     db_manager.ping()
+    await db_manager.ensure_indexes()
     items = await grab_items("python", db_manager)
     print(len(items))
     # items = [{"url": "https://hh.ru/vacancy/90329992"}]
@@ -152,7 +153,7 @@ if __name__ == "__main__":
     asyncio.run(main())
     
 # алгоритм работы авторассылки
-# Дёргаем из базы все записи с is_actual = True, is_archived = False, responded = False
+# Дёргаем из базы все записи с last_seen_run из последнего запуска, is_archived = False, responded = False
 # Открываем один браузер и в нём по очереди переходим по ссылкам на вакансии и оставляем отклики
 # нужно делать большие паузы между откликами, чтобы не забанили
 # после отклика в базе меняем responded на True
@@ -0,0 +1,113 @@
+"""
+Before/after benchmark for html_scraper http clients.
+
+Starts a local keep-alive stub server and fetches the same amount of pages
+with a fresh httpx.AsyncClient per request (old behaviour)
+and with the shared ClientRegistry client.
+
+    python benchmarks/bench_http_clients.py --requests 500 --concurrency 20
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from headers import headers
+# http_clients doesn't import proxies, benchmark runs offline
+from http_clients import ClientRegistry
+
+BODY = ("<html><body>" + "<div class='serp-item'>vacancy</div>" * 200 + "</body></html>").encode()
+
+
+class StubServer:
+    """ minimal HTTP/1.1 server which supports keep-alive and counts connections """
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                if not request:
+                    break
+                self.requests += 1
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: text/html; charset=utf-8\r\n"
+                             b"Content-Length: " + str(len(BODY)).encode() + b"\r\n"
+                             b"Connection: keep-alive\r\n\r\n" + BODY)
+                await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/vacancy/"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def fetch_fresh_client(url, semaphore):
+    async with semaphore:
+        async with httpx.AsyncClient(headers=headers) as client:
+            response = await client.get(url, timeout=60, follow_redirects=True)
+            return response.text
+
+
+async def fetch_registry_client(url, semaphore, registry):
+    async with semaphore:
+        response = await registry.get_client(None).get(url)
+        return response.text
+
+
+async def run_case(name, base_url, total, concurrency, fetcher):
+    server_stats_before = (stub.connections, stub.requests)
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    await asyncio.gather(*[fetcher(base_url + str(i), semaphore) for i in range(total)])
+
+    elapsed = time.perf_counter() - start
+    connections = stub.connections - server_stats_before[0]
+    print(f"{name:<16} {total / elapsed:10.1f} req/s "
+          f"{elapsed:8.2f} s   tcp connections: {connections}")
+    return elapsed
+
+
+async def main(total, concurrency):
+    global stub
+    stub = StubServer()
+    base_url = await stub.start()
+
+    before = await run_case("fresh client", base_url, total, concurrency, fetch_fresh_client)
+
+    registry = ClientRegistry()
+    after = await run_case("client registry", base_url, total, concurrency,
+                           lambda url, semaphore: fetch_registry_client(url, semaphore, registry))
+    await registry.close()
+    await stub.stop()
+
+    print(f"speedup: x{before / after:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,101 @@
+"""
+Benchmark of VacancyRAW: parsing of SERP items, serialisation to mongo documents and back,
+and memory of many live objects.
+
+Slotted model with the generated codec is compared with the same fields
+in a plain dataclass serialised by dataclasses.asdict, like the model was before.
+
+    python benchmarks/bench_models.py
+    python benchmarks/bench_models.py --count 50000 --rounds 10
+"""
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import contextlib
+import tracemalloc
+import dataclasses
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# parsers convert salaries, benchmark must not depend on the currency api
+os.environ.setdefault("CURRENCY_RATES_OFFLINE", "1")
+
+from models import VacancyRAW
+from parsers import parse_serp_page
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+# the same fields without slots and codec
+PlainVacancy = dataclasses.make_dataclass(
+    "PlainVacancy", [(item.name, item.type, item) for item in dataclasses.fields(VacancyRAW)])
+
+
+def parse_corpus():
+    pages = [path.read_text(encoding="utf-8") for path in sorted((CORPUS_DIR / "serp").glob("*.html"))]
+    start = time.perf_counter()
+
+    logging.disable(logging.CRITICAL)
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = [item for html in pages for item in parse_serp_page(html, "python") if item]
+    logging.disable(logging.NOTSET)
+
+    return items, time.perf_counter() - start
+
+
+def best_time(func, rounds):
+    best = float("inf")
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def allocated(factory):
+    """ bytes held by objects built by factory """
+    tracemalloc.start()
+    objects = factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20000, help="objects per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    items, parse_seconds = parse_corpus()
+    print(f"{'parse_serp_page':<28} {len(items) / parse_seconds:>12.1f} items/s")
+
+    items = (items * (args.count // len(items) + 1))[:args.count]
+    documents = [item.to_document() for item in items]
+    plain_items = [PlainVacancy(**dataclasses.asdict(item)) for item in items]
+
+    results = {
+        "slotted to_document": best_time(lambda: [item.to_document() for item in items], args.rounds),
+        "plain asdict": best_time(lambda: [dataclasses.asdict(item) for item in plain_items], args.rounds),
+        "slotted from_document": best_time(lambda: [VacancyRAW.from_document(document)
+                                                    for document in documents], args.rounds),
+        "plain from dict": best_time(lambda: [PlainVacancy(**document) for document in documents], args.rounds),
+    }
+
+    for name, seconds in results.items():
+        print(f"{name:<28} {args.count / seconds:>12.1f} items/s")
+
+    slotted = allocated(lambda: [VacancyRAW.from_document(document) for document in documents])
+    plain = allocated(lambda: [PlainVacancy(**document) for document in documents])
+    print(f"{'slotted memory':<28} {slotted / args.count:>12.1f} bytes/item")
+    print(f"{'plain memory':<28} {plain / args.count:>12.1f} bytes/item")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
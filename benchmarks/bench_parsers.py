@@ -0,0 +1,194 @@
+"""
+Offline benchmark of parsers over the checked-in corpus of hh pages.
+
+Reports pages/sec and items/sec for every parser and compares results with baseline.json:
+changed output means parsers don't give the same result on the corpus anymore,
+signature has counts of parsed fields and a hash of their values, so wrong but present values fail too,
+lower relative speed than baseline minus tolerance means performance regression.
+Speed is compared relative to plain HTMLParser parsing of the same pages measured in the same run,
+absolute pages/sec depend on the machine and are only reported.
+
+The corpus is generated by make_corpus.py from the markup parsers expect,
+so it catches regressions of parsers, not changes of the real hh markup.
+Real pages can be added to corpus/serp and corpus/vacancy (anonymised), then run --save.
+
+    python benchmarks/bench_parsers.py            # compare with baseline
+    python benchmarks/bench_parsers.py --save     # write new baseline
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# parsers convert salaries, benchmark must not depend on the currency api
+os.environ.setdefault("CURRENCY_RATES_OFFLINE", "1")
+
+from selectolax.parser import HTMLParser
+
+# only parsers are imported, network and proxy modules are not needed offline
+from parsers import (parse_serp_page, parse_pagination, parse_description, parse_key_skills,
+                     parse_company_address, parse_employment_type, detect_is_archived)
+
+BENCH_DIR = Path(__file__).resolve().parent
+CORPUS_DIR = BENCH_DIR / "corpus"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+SERP_FIELDS = ("title", "salary", "salary_min", "salary_max", "salary_currency", "url", "city",
+               "experience_min", "company_name", "company_page", "source_id")
+
+
+def load_corpus():
+    serp = [path.read_text(encoding="utf-8") for path in sorted((CORPUS_DIR / "serp").glob("*.html"))]
+    vacancy = [path.read_text(encoding="utf-8") for path in sorted((CORPUS_DIR / "vacancy").glob("*.html"))]
+    return serp, vacancy
+
+
+def values_hash(rows):
+    """ hash of the values which doesn't depend on the order of rows """
+    encoded = sorted(json.dumps(row, ensure_ascii=False, default=str) for row in rows)
+    return hashlib.sha256("\n".join(encoded).encode("utf-8")).hexdigest()
+
+
+def serp_signature(results):
+    items = [item for page in results for item in page if item]
+    signature = {"items": len(items), "fresh": sum(1 for item in items if item.fresh)}
+
+    for field in SERP_FIELDS:
+        signature[field] = sum(1 for item in items if getattr(item, field) is not None)
+
+    signature["salary_min_sum"] = sum(item.salary_min or 0 for item in items)
+    signature["salary_max_sum"] = sum(item.salary_max or 0 for item in items)
+    signature["values_hash"] = values_hash([[getattr(item, field) for field in SERP_FIELDS] for item in items])
+    return signature
+
+
+def parse_details(html):
+    selectolax = HTMLParser(html)
+    return (parse_description(selectolax), parse_key_skills(selectolax),
+            parse_company_address(selectolax), parse_employment_type(selectolax))
+
+
+def details_signature(results):
+    return {"items": len(results),
+            "description": sum(1 for result in results if result[0]),
+            "key_skills": sum(len(result[1]) for result in results),
+            "company_address": sum(1 for result in results if result[2]),
+            "employment_type": sum(1 for result in results if result[3]),
+            "values_hash": values_hash(results)}
+
+
+BENCHMARKS = {
+    "parse_serp_page": ("serp", lambda html: parse_serp_page(html, "python"), serp_signature,
+                        lambda results: sum(len(page) for page in results)),
+    "parse_pagination": ("serp", parse_pagination, lambda results: {"pages": sum(results)}, len),
+    "validator.parse_details": ("vacancy", parse_details, details_signature, len),
+    "detect_is_archived": ("vacancy", detect_is_archived,
+                           lambda results: {"archived": sum(results), "items": len(results)}, len),
+}
+
+
+def timed(pages, func):
+    start = time.perf_counter()
+    results = [func(html) for html in pages]
+    return results, time.perf_counter() - start
+
+
+def run_benchmark(pages, func, rounds):
+    """ 
+    best round time, it is much less noisy than the average.
+    Plain HTMLParser rounds are interleaved with the benchmark ones, 
+    so both see the same load of the machine.
+    """
+    results = [func(html) for html in pages]
+    best, reference = float("inf"), float("inf")
+
+    for _ in range(rounds):
+        reference = min(reference, timed(pages, HTMLParser)[1])
+        results, elapsed = timed(pages, func)
+        best = min(best, elapsed)
+
+    return results, best, reference
+
+
+def run_all(rounds):
+    serp, vacancy = load_corpus()
+    corpus = {"serp": serp, "vacancy": vacancy}
+    report = {}
+
+    for name, (kind, func, signature, count_items) in BENCHMARKS.items():
+        pages = corpus[kind]
+        # reference is the speed of this machine, html parsing without any selectors
+        results, elapsed, reference = run_benchmark(pages, func, rounds)
+        report[name] = {
+            "pages_per_sec": round(len(pages) / elapsed, 2),
+            "items_per_sec": round(count_items(results) / elapsed, 2),
+            "relative_speed": round(reference / elapsed, 4),
+            "signature": signature(results),
+        }
+
+    return report
+
+
+def compare(report, baseline, tolerance):
+    failures = []
+
+    for name, result in report.items():
+        expected = baseline.get(name)
+
+        if expected is None:
+            continue
+
+        if result["signature"] != expected["signature"]:
+            failures.append(f"{name}: output changed {expected['signature']} -> {result['signature']}")
+
+        # baselines saved before relative speed was measured can't be compared across machines
+        if "relative_speed" in expected and result["relative_speed"] < expected["relative_speed"] * (1 - tolerance):
+            failures.append(f"{name}: slower than baseline relative to plain html parsing "
+                            f"{expected['relative_speed']} -> {result['relative_speed']}")
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown of relative speed compared to baseline, 0.5 is 50%%")
+    parser.add_argument("--save", action="store_true", help="save results as a new baseline")
+    args = parser.parse_args(argv)
+
+    # parsers log and print missing fields, it shouldn't flood the report
+    logging.disable(logging.CRITICAL)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = run_all(args.rounds)
+    logging.disable(logging.NOTSET)
+
+    for name, result in report.items():
+        print(f"{name:<26} {result['pages_per_sec']:>10.1f} pages/s {result['items_per_sec']:>12.1f} items/s "
+              f"{result['relative_speed']:>8.3f} of plain parsing")
+
+    if args.save:
+        BASELINE_PATH.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {BASELINE_PATH}")
+        return 0
+
+    if not BASELINE_PATH.exists():
+        print("No baseline found, run with --save first")
+        return 0
+
+    failures = compare(report, json.loads(BASELINE_PATH.read_text(encoding="utf-8")), args.tolerance)
+
+    for failure in failures:
+        print(failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Generates benchmark corpus of hh.ru pages.
+
+Pages repeat the markup of real hh SERP and vacancy pages (the same data-qa attributes,
+classes, non-breaking spaces in salaries, page chrome around the content),
+but every company, title, address and id is made up.
+Output is deterministic, corpus is checked in, so run it only when markup has to be updated.
+Pages are made from the selectors parsers use, so the corpus can't show that real hh markup changed,
+only real pages can do it.
+
+    python benchmarks/make_corpus.py
+"""
+import random
+from pathlib import Path
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+SERP_PAGES = 6
+ITEMS_PER_PAGE = 20
+ACTIVE_VACANCIES = 8
+ARCHIVED_VACANCIES = 4
+
+TITLES = ["Python разработчик", "Senior Data Engineer", "Frontend developer (React)",
+          "Backend-разработчик Go", "Аналитик данных", "Junior Python Developer",
+          "Специалист по парсингу", "Fullstack JavaScript developer", "Программист 1С",
+          "DevOps инженер", "QA Automation (Python)", "ML Engineer"]
+COMPANIES = ["ООО Альфа Софт", "Бета Системс", "ИП Гамма", "ООО Дельта Диджитал",
+             "Эпсилон Тех", "ООО Зета Лаб", "Эта Консалтинг", "Тета Групп"]
+CITIES = ["Москва", "Санкт-Петербург", "Алматы", "Новосибирск", "Баку", "Казань"]
+EXPERIENCE = ["Без опыта", "Опыт 1–3 года", "Опыт 3–6 лет", "Опыт более 6 лет"]
+SKILLS = ["Python", "SQL", "PostgreSQL", "Django", "FastAPI", "Docker", "Git", "Linux",
+          "React", "TypeScript", "Kafka", "Airflow", "Pandas", "Scrapy", "Selenium", "Redis"]
+# hh separates thousands with narrow no-break space and currency with no-break space
+SALARIES = [None,
+            "от 150\u202f000\xa0₽ на\xa0руки",
+            "150\u202f000 – 250\u202f000\xa0₽ на\xa0руки",
+            "до 300\u202f000\xa0₽ до\xa0вычета налогов",
+            "200\u202f000\xa0₽",
+            "3\u202f000 – 5\u202f000\xa0$",
+            "от 4\u202f000\xa0€",
+            "500\u202f000 – 900\u202f000\xa0₸"]
+
+CHROME_HEAD = """<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">
+<title>{title}</title>
+<script>window.globalVars = {{"lang": "RU", "area": "1", "features": [{features}]}};</script>
+<style>{styles}</style></head><body class="s-friendly">
+<div class="supernova-navi-wrapper"><div class="supernova-navi">{navi}</div></div>
+<div class="main-content">"""
+CHROME_FOOT = """</div><div class="footer">{footer}</div>
+<script>{scripts}</script></body></html>"""
+
+
+def chrome_parts(rnd, title):
+    features = ", ".join(f'"feature_{rnd.randint(0, 10 ** 6)}"' for _ in range(300))
+    styles = "\n".join(f".c{i}{{margin:{i % 7}px;padding:{i % 5}px}}" for i in range(600))
+    navi = "".join(f'<a class="supernova-link" href="/section/{i}">Раздел {i}</a>' for i in range(60))
+    footer = "".join(f'<div class="footer-column"><a href="/info/{i}">Информация {i}</a></div>'
+                     for i in range(80))
+    scripts = "\n".join(f"window.__m{i}=function(a){{return a*{i}}};" for i in range(800))
+    head = CHROME_HEAD.format(title=title, features=features, styles=styles, navi=navi)
+    return head, CHROME_FOOT.format(footer=footer, scripts=scripts)
+
+
+def serp_item(rnd, vacancy_id):
+    salary = rnd.choice(SALARIES)
+    salary_html = (f'<span data-qa="vacancy-serp__vacancy-compensation" '
+                   f'class="bloko-header-section-2">{salary}</span>' if salary else "")
+    fresh = ('<span data-qa="vacancy-label-be-first" class="label">Откликнитесь среди первых</span>'
+             if rnd.random() < 0.3 else "")
+    employer_id = rnd.randint(10 ** 5, 10 ** 7)
+    return f"""
+<div class="serp-item serp-item_link" data-qa="vacancy-serp__vacancy vacancy-serp__vacancy_standard">
+ <div class="vacancy-serp-item-body"><div class="vacancy-serp-item-body__main-info">
+  <h3 class="bloko-header-section-3"><span data-page-analytics-event="vacancy_search_suitable_item">
+   <a class="bloko-link" target="_blank" href="https://hh.ru/vacancy/{vacancy_id}?from=vacancy_search_list&amp;query=python">
+    <span data-qa="serp-item__title" class="serp-item__title">{rnd.choice(TITLES)}</span></a></span></h3>
+  {salary_html}
+  <div class="vacancy-serp-item__info">
+   <div class="bloko-text"><div class="vacancy-serp-item__meta-info-company">
+    <a data-qa="vacancy-serp__vacancy-employer" class="bloko-link bloko-link_kind-tertiary" href="/employer/{employer_id}?hhtmFrom=vacancy_search_list">{rnd.choice(COMPANIES)}</a></div></div>
+   <div data-qa="vacancy-serp__vacancy-address" class="bloko-text">{rnd.choice(CITIES)}</div>
+  </div>
+  <div data-qa="vacancy-serp__vacancy-work-experience" class="bloko-text">{rnd.choice(EXPERIENCE)}</div>
+  {fresh}
+ </div>
+ <div class="vacancy-serp-item-controls">
+  <a data-qa="vacancy-serp__vacancy_response" class="bloko-button bloko-button_kind-primary" href="/applicant/vacancy_response?vacancyId={vacancy_id}&amp;hhtmFrom=vacancy_search_list"><span>Откликнуться</span></a>
+  <button class="bloko-icon-link" data-qa="vacancy-serp__vacancy_hide"><span class="bloko-icon"></span></button>
+ </div></div></div>"""
+
+
+def serp_page(rnd, page_number):
+    head, foot = chrome_parts(rnd, "Работа python в Москве")
+    items = "".join(serp_item(rnd, rnd.randint(8 * 10 ** 7, 10 ** 8)) for _ in range(ITEMS_PER_PAGE))
+    pager = "".join(f'<span class="pager-item-not-in-short-range"><a data-qa="pager-page" class="bloko-button" '
+                    f'href="/search/vacancy?text=python&amp;page={i}"><span>{i + 1}</span></a></span>'
+                    for i in range(10))
+    pager += '<span class="pager-item-not-in-short-range"><a data-qa="pager-page" class="bloko-button" href="/search/vacancy?text=python&amp;page=39"><span>40</span></a></span>'
+    return (head + f'<div id="a11y-main-content" data-qa="vacancy-serp__results">{items}</div>'
+            f'<div class="pager" data-qa="pager-block">{pager}'
+            f'<a data-qa="pager-next" class="bloko-button" href="/search/vacancy?text=python&amp;page={page_number + 1}">дальше</a></div>'
+            + foot)
+
+
+def vacancy_page(rnd, archived):
+    head, foot = chrome_parts(rnd, "Вакансия")
+    paragraphs = "".join(
+        f"<p>Мы ищем коллегу в команду {rnd.choice(COMPANIES)}. Стек: {', '.join(rnd.sample(SKILLS, 4))}. "
+        f"Задачи: разработка сервисов, ревью кода, поддержка пайплайнов данных.</p>"
+        f"<ul>{''.join(f'<li>Требование {j}: опыт с {rnd.choice(SKILLS)}</li>' for j in range(5))}</ul>"
+        for _ in range(6))
+    skills = "".join(f'<div class="bloko-tag bloko-tag_inline"><span data-qa="bloko-tag__text">{skill}</span></div>'
+                     for skill in rnd.sample(SKILLS, rnd.randint(0, 8)))
+    archive = ('<div class="vacancy-section"><h2 data-qa="bloko-header-2" class="bloko-header-section-2">'
+               'Вакансия в архиве</h2><p>Работодатель, вероятно, уже нашел нужного кандидата</p></div>'
+               if archived else "")
+    address = (f'<span data-qa="vacancy-view-raw-address">{rnd.choice(CITIES)}, улица Примерная, {rnd.randint(1, 99)}</span>'
+               if rnd.random() < 0.6 else f'<p data-qa="vacancy-view-location">{rnd.choice(CITIES)}</p>')
+    body = f"""
+<div class="vacancy-title"><h1 data-qa="vacancy-title" class="bloko-header-section-1">{rnd.choice(TITLES)}</h1></div>
+{archive}
+<p class="vacancy-description-list-item" data-qa="vacancy-view-employment-mode">Полная занятость, <span>удаленная работа</span></p>
+<div class="vacancy-company-details"><a data-qa="vacancy-company-name" href="/employer/{rnd.randint(10 ** 5, 10 ** 7)}">{rnd.choice(COMPANIES)}</a></div>
+{address}
+<div class="vacancy-section"><div class="g-user-content" data-qa="vacancy-description">{paragraphs}</div></div>
+<div class="vacancy-section"><h2 data-qa="bloko-header-2">Ключевые навыки</h2><div class="bloko-tag-list">{skills}</div></div>"""
+    return head + body + foot
+
+
+def main():
+    rnd = random.Random(20240115)
+
+    for name in ("serp", "vacancy"):
+        (CORPUS_DIR / name).mkdir(parents=True, exist_ok=True)
+
+    for i in range(SERP_PAGES):
+        (CORPUS_DIR / "serp" / f"serp_{i:02d}.html").write_text(serp_page(rnd, i), encoding="utf-8")
+
+    for i in range(ACTIVE_VACANCIES):
+        (CORPUS_DIR / "vacancy" / f"active_{i:02d}.html").write_text(vacancy_page(rnd, False), encoding="utf-8")
+
+    for i in range(ARCHIVED_VACANCIES):
+        (CORPUS_DIR / "vacancy" / f"archived_{i:02d}.html").write_text(vacancy_page(rnd, True), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
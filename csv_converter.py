@@ -1,27 +1,17 @@
-import pandas as pd
-
+""" kept for compatibility, output.csv is written by exporter now """
 import asyncio
 
 from db_operations import MongoConnector
+from exporter import export_csv
 
 
 async def main():
     db_manager = MongoConnector()
     db_manager.ping()
 
-    selected_columns = ["title", "salary_min", "salary_max", "experience", "company_name", "when_scraped", "employment_type", "key_skills"]
-    cursor = db_manager.collection.find({}, {column: 1 for column in selected_columns})
-    data = [item async for item in cursor]
-
-    # Convert data to a pandas DataFrame
-    df = pd.DataFrame(data)
-    df = df.drop('_id', axis=1)
-    df.reset_index(drop=True, inplace=True)
-    # Save DataFrame to CSV
-    df.to_csv('output.csv', index=False)
-
+    await export_csv(db_manager, "output.csv")
 
     await db_manager.close_connection()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main()) 
@@ -0,0 +1,135 @@
+"""
+Currency rates for salary conversion.
+Rates are fetched lazily, cached on disk with TTL and served from memory.
+Rates are amount of currency for 1 RUB, like freecurrencyapi returns them for RUB base.
+"""
+import os
+import json
+import time
+import logging
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CUR_CONVERTER_KEY = os.getenv("CURRENCY_API_KEY")
+RATES_URL = "https://api.freecurrencyapi.com/v1/latest"
+RATES_CACHE_PATH = os.getenv("CURRENCY_RATES_CACHE", ".cache/currency_rates.json")
+RATES_TTL = 12 * 60 * 60
+# CURRENCY_RATES_OFFLINE=1 never goes to network, CURRENCY_FIXED_RATES='{"USD": 0.011}' pins rates
+OFFLINE = os.getenv("CURRENCY_RATES_OFFLINE", "") in ("1", "true", "yes")
+FIXED_RATES = json.loads(os.getenv("CURRENCY_FIXED_RATES", "null"))
+
+# fallback table, also the only source for currencies which freecurrencyapi doesn't have
+DEFAULT_RATES = {
+    "RUB": 1.0,
+    "USD": 0.011,
+    "EUR": 0.01,
+    "KZT": 5.1,
+    "AZN": 0.019,
+}
+FETCHED_CURRENCIES = "RUB,USD,EUR"
+
+
+class RatesProvider:
+
+    def __init__(self, cache_path=RATES_CACHE_PATH, ttl=RATES_TTL,
+                 offline=OFFLINE, fixed_rates=FIXED_RATES):
+        self.cache_path = Path(cache_path)
+        self.ttl = ttl
+        self.offline = offline
+        self.fixed_rates = fixed_rates
+        self.rates = None
+
+    def request_params(self):
+        return {"apikey": CUR_CONVERTER_KEY,
+                "base_currency": "RUB",
+                "currencies": FETCHED_CURRENCIES}
+
+    def read_cache(self, fresh_only=True):
+        try:
+            cached = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+        if fresh_only and time.time() - cached.get("fetched_at", 0) > self.ttl:
+            return None
+
+        return cached.get("rates")
+
+    def write_cache(self, rates):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps({"fetched_at": time.time(), "rates": rates}),
+                                       encoding="utf-8")
+        except OSError as exc:
+            logging.warning("Can't save currency rates cache: %s", exc)
+
+    def remember(self, rates):
+        self.rates = {**DEFAULT_RATES, **rates}
+        return self.rates
+
+    def from_cache_or_defaults(self):
+        """ used when there is no fresh cache and network is not allowed or failed """
+        stale = self.read_cache(fresh_only=False)
+
+        if stale:
+            logging.warning("Using stale currency rates from cache")
+            return self.remember(stale)
+
+        logging.warning("Using default currency rates")
+        return self.remember({})
+
+    def cached_rates(self):
+        """ rates which don't need network, None if rates have to be fetched """
+        if self.rates is not None:
+            return self.rates
+
+        if self.fixed_rates:
+            return self.remember(self.fixed_rates)
+
+        cached = self.read_cache()
+        if cached:
+            return self.remember(cached)
+
+        if self.offline:
+            return self.from_cache_or_defaults()
+
+        return None
+
+    def save_fetched(self, response):
+        response.raise_for_status()
+        rates = response.json()["data"]
+        self.write_cache(rates)
+        logging.info("Currency rates fetched: %s", rates)
+        return self.remember(rates)
+
+    def get_rates(self):
+        """ sync access for parsers, network is used only once per TTL """
+        rates = self.cached_rates()
+        if rates is not None:
+            return rates
+
+        try:
+            return self.save_fetched(httpx.get(RATES_URL, params=self.request_params(), timeout=10))
+        except (httpx.HTTPError, KeyError, ValueError) as exc:
+            logging.warning("Can't fetch currency rates: %s", exc)
+            return self.from_cache_or_defaults()
+
+    async def load(self):
+        """ async variant to warm up rates at the start of the run """
+        rates = self.cached_rates()
+        if rates is not None:
+            return rates
+
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                return self.save_fetched(await client.get(RATES_URL, params=self.request_params()))
+        except (httpx.HTTPError, KeyError, ValueError) as exc:
+            logging.warning("Can't fetch currency rates: %s", exc)
+            return self.from_cache_or_defaults()
+
+
+rates_provider = RatesProvider()
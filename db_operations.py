@@ -1,11 +1,32 @@
 import os
+import time
+import asyncio
 import logging
+from datetime import datetime, timedelta
+from dataclasses import dataclass
 
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, IndexModel, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+from skill_index import SkillIndex, VACANCY_PROJECTION
 
 load_dotenv()
 
+# old documents keep search_strings as a plain string, it is wrapped into array in pipeline updates
+SEARCH_STRINGS_ARRAY = {"$cond": [{"$isArray": "$search_strings"},
+                                  "$search_strings",
+                                  {"$cond": [{"$eq": [{"$type": "$search_strings"}, "string"]},
+                                             ["$search_strings"], []]}]}
+# failed bulk write is retried, then the batch is put back to the buffer
+FLUSH_ATTEMPTS = 3
+FLUSH_RETRY_DELAY = 1.0
+# incremental readers of updated_at read this much before their watermark again
+UPDATED_AT_OVERLAP = timedelta(minutes=1)
+# collections smaller than this can be scanned, audit doesn't fail on them
+AUDIT_COLLSCAN_THRESHOLD = 1000
+
 uri = os.getenv("MONGO_CONNECTION_STRING")
 # Create a new client and connect to the server
 
@@ -16,6 +37,12 @@ class MongoConnector:
         self.db = self.client.data
         self.collection = self.db.hh
         self.userdata = self.db.userdata
+        self.runs = self.db.runs
+        self.skill_demand = self.db.skill_demand
+        self.skill_index = SkillIndex(self.skill_demand)
+        self.run_id = None
+        # find and update of add_search_string must not interleave for the same search string
+        self.search_string_locks = {}
         
     def ping(self):
         try:
@@ -24,51 +51,213 @@ class MongoConnector:
         except Exception as e:
             print("Don't have a connection to MongoDB")
 
+    async def ensure_indexes(self):
+        """ 
+        Indexes for every query of the connector, creation is skipped by mongo if index exists.
+        Equality fields go first and range fields last in compound indexes.
+        """
+        await self.ensure_source_id_index()
+        await self.collection.create_indexes([
+            # grab_for_autosending
+            IndexModel([("search_strings", ASCENDING), ("is_archived", ASCENDING), 
+                        ("responded", ASCENDING), ("last_seen_run", ASCENDING)]),
+            # not_scraped_query of afterscraper
+            IndexModel([("is_archived", ASCENDING), ("last_seen_run", ASCENDING)]),
+            # incremental export and salary stats
+            IndexModel([("updated_at", ASCENDING)]),
+        ])
+        await self.userdata.create_index("username")
+        await self.runs.create_index("run_id")
+        await self.skill_index.ensure_indexes()
+        # salary_stats imports pandas, it is not needed by the rest of the connector
+        from salary_stats import SalaryStats
+        await SalaryStats(self).ensure_indexes()
+        logging.info("Indexes are ensured")
+
+    async def ensure_source_id_index(self):
+        """
+        Unique source_id index keeps upserts from inserting duplicates. Old races stored duplicate vacancies,
+        they are merged by migrations.deduplicate_source_ids before the index is built.
+        If it still can't be built, non-unique index keeps lookups by source_id from scanning the collection.
+        Returns True if the unique index exists.
+        """
+        index = (await self.collection.index_information()).get("source_id_1")
+
+        if index and index.get("unique"):
+            return True
+
+        # migrations imports this module
+        from migrations import deduplicate_source_ids
+        await deduplicate_source_ids(self)
+
+        if index:
+            # index with the same key can't be created with other options
+            await self.collection.drop_index("source_id_1")
+
+        try:
+            await self.collection.create_index("source_id", unique=True)
+            return True
+
+        except OperationFailure as exc:
+            logging.critical("UNIQUE source_id INDEX CAN'T BE BUILT, duplicate vacancies can be stored "
+                             "until it is fixed, non-unique index is used: %s", exc)
+            await self.collection.create_index("source_id")
+            return False
+
+    def autosending_query(self, latest_run, search_string):
+        # before the first finished run only old is_actual flag is available
+        actual = {"last_seen_run": {"$gte": latest_run}} if latest_run else {"is_actual": True}
+        return {**actual, "is_archived": False, "responded": False, "search_strings": search_string}
+
+    def not_scraped_query(self, run_id):
+        """ items which are not seen in the run and not archived """
+        return {"last_seen_run": {"$ne": run_id}, "is_archived": False}
+
+    def changed_since(self, watermark):
+        """ 
+        query of vacancies changed after the watermark. updated_at is stamped by the server,
+        but a write stamped before the watermark can commit after it was read, so some overlap is read again
+        """
+        return {"updated_at": {"$gt": watermark - UPDATED_AT_OVERLAP}} if watermark else {}
+
     async def send_to_db(self, data):
         
-        json_to_send = {
-            # use models.py to create a json
-            "title": data.title,
-            "salary_type": data.salary_type,
-            "salary": data.salary,
-            "url": data.url,
-            "city": data.city,
-            "experience": data.experience,
-            "fresh": data.fresh,
-            "is_actual": data.is_actual,
-            "company_name": data.company_name,
-            "company_page": data.company_page,
-            "search_strings": data.search_strings,
-            "when_scraped": data.when_scraped,
-            "company_address": data.company_address,
-            "description": data.description,
-            "employment_type": data.employment_type,
-            "source_id": data.source_id,
-            "key_skills": data.key_skills,
-            "is_scraped": data.is_scraped,
-            "is_archived": data.is_archived,
-            "responded": data.responded,
-            "salary_min": data.salary_min,
-            "salary_max": data.salary_max
-        }
-
-        await self.collection.insert_one(json_to_send)
+        json_to_send = data.to_document()
+        json_to_send["search_strings"] = json_to_send["search_strings"] or []
+        # actuality is defined by last_seen_run, like in BulkVacancyWriter.upsert_operation
+        json_to_send.pop("is_actual")
+
+        # updated_at is stamped by the server like every other update
+        result = await self.collection.update_one({"source_id": data.source_id},
+                                                  {"$setOnInsert": json_to_send,
+                                                   "$set": {"last_seen_run": self.run_id},
+                                                   "$currentDate": {"updated_at": True}},
+                                                  upsert=True)
+        if result.upserted_id is not None:
+            await self.skill_index.add_vacancies([json_to_send])
+
+        else:
+            for search_string in json_to_send["search_strings"]:
+                await self.add_search_string([data.source_id], search_string)
         logging.info(f"Item {data.source_id} sent to db")
 
     async def find_item_by_id(self, id):
         result = await self.collection.find_one({"source_id": id})
         return result
 
-    async def refresh_is_actual(self):
-        await self.collection.update_many({}, {"$set": {"is_actual": False}})
-        logging.info("is_actual refreshed")
+    async def find_known_ids(self, ids):
+        """ one $in query for all ids of a SERP page, returns ids which are already stored """
+        if not ids:
+            return set()
+
+        cursor = self.collection.find({"source_id": {"$in": list(ids)}}, {"source_id": 1, "_id": 0})
+        return {item["source_id"] async for item in cursor}
+
+    async def load_known_ids(self):
+        # range over all strings lets mongo read only the source_id index instead of the documents
+        cursor = self.collection.find({"source_id": {"$gte": ""}}, {"source_id": 1, "_id": 0})
+        known_ids = {item["source_id"] async for item in cursor if item.get("source_id")}
+        logging.info(f"Loaded {len(known_ids)} known ids")
+        return known_ids
+
+    async def mark_seen(self, ids, search_string):
+        """ 
+        stamp current run for all the ids, vacancies which already have the search string are updated at once,
+        being seen again is not a change for exporter, so their updated_at is kept
+        """
+        if not ids:
+            return 0
 
-    async def set_is_actual_true(self, id):
-        await self.collection.update_one({"source_id": id}, {"$set": {"is_actual": True}})
-        logging.info(f"Item {id} is_actual set to True")
+        ids = list(ids)
+        result = await self.collection.update_many({"source_id": {"$in": ids}, "search_strings": search_string},
+                                                   {"$set": {"last_seen_run": self.run_id}})
+        added = await self.add_search_string(ids, search_string)
+        logging.info(f"{result.matched_count + added} items marked as seen, {added} of them with a new search string")
+        return result.matched_count + added
+
+    async def add_search_string(self, ids, search_string):
+        """
+        add search string to the vacancies which don't have it yet and count them in the skill index.
+        Vacancies are read by one find and updated by one bulk write, skill index gets their state before the update.
+        Callers of this connector are serialized per search string, so the string is counted once.
+        Returns amount of updated vacancies.
+        """
+        lock = self.search_string_locks.setdefault(search_string, asyncio.Lock())
+
+        async with lock:
+            cursor = self.collection.find({"source_id": {"$in": list(ids)}, "search_strings": {"$ne": search_string}},
+                                          {**VACANCY_PROJECTION, "is_archived": 1, "source_id": 1})
+            documents = [document async for document in cursor]
+
+            if not documents:
+                return 0
+
+            update = [{"$set": {"search_strings": {"$setUnion": [SEARCH_STRINGS_ARRAY, [search_string]]},
+                                "updated_at": "$$NOW",
+                                "last_seen_run": self.run_id}}]
+            # guard keeps the string from being added twice if another process added it after the find
+            result = await self.collection.bulk_write(
+                [UpdateOne({"_id": document["_id"], "search_strings": {"$ne": search_string}}, update)
+                 for document in documents], ordered=False)
+
+        if result.modified_count < len(documents):
+            # it is not known which of them were added by the other process, they are counted here too
+            logging.warning("%s vacancies got search string %s from another process, "
+                            "skill index counters can be restored with skill_index rebuild",
+                            len(documents) - result.modified_count, search_string)
+
+        try:
+            await self.skill_index.add_search_string(documents, search_string)
+
+        except Exception as exc:
+            # counters can be restored with skill_index rebuild, vacancies are already updated
+            logging.error("Skill index update failed: %s", exc)
+
+        return result.modified_count
+
+    async def start_run(self):
+        """ 
+        Every run gets increasing run_id, seen items are stamped with it in last_seen_run.
+        Item is actual if it was seen in the latest finished run (or in the running one).
+        """
+        counter = await self.runs.find_one_and_update({"_id": "run_counter"},
+                                                      {"$inc": {"value": 1}},
+                                                      upsert=True,
+                                                      return_document=ReturnDocument.AFTER)
+        self.run_id = counter["value"]
+        await self.runs.insert_one({"run_id": self.run_id, 
+                                    "started_at": datetime.utcnow(), 
+                                    "finished_at": None})
+        logging.info(f"Run {self.run_id} started")
+        return self.run_id
+
+    async def finish_run(self):
+        await self.runs.update_one({"run_id": self.run_id}, 
+                                   {"$set": {"finished_at": datetime.utcnow()}})
+        logging.info(f"Run {self.run_id} finished")
+
+    async def latest_run_id(self):
+        """ id of the latest finished run """
+        run = await self.runs.find_one({"run_id": {"$exists": True}, "finished_at": {"$ne": None}},
+                                       sort=[("run_id", DESCENDING)])
+        return run["run_id"] if run else None
+
+    async def current_run_id(self):
+        return self.run_id if self.run_id is not None else await self.latest_run_id()
+
+    async def set_seen(self, id, extra_fields=None):
+        await self.collection.update_one({"source_id": id}, 
+                                         {"$set": {"last_seen_run": self.run_id, **(extra_fields or {})}})
+        logging.info(f"Item {id} seen in run {self.run_id}")
 
     async def set_is_archived_true(self, id):
-        await self.collection.update_one({"source_id": id}, {"$set": {"is_archived": True}})
+        # previous state tells if the vacancy is archived now and which counters it had
+        document = await self.collection.find_one_and_update({"source_id": id, "is_archived": {"$ne": True}},
+                                                             {"$set": {"is_archived": True},
+                                                              "$currentDate": {"updated_at": True}},
+                                                             projection=VACANCY_PROJECTION)
+        if document:
+            await self.skill_index.archive_vacancy(document)
         logging.info(f"Item {id} is_archived set to True")
 
     async def close_connection(self):
@@ -76,15 +265,73 @@ class MongoConnector:
         print("DB Connection closed")   
 
     async def grab_for_autosending(self, search_string):
-        result = self.collection.find({"is_actual": True, "is_archived": False, "responded": False, "search_strings": search_string})
+        latest_run = await self.latest_run_id()
+        result = self.collection.find(self.autosending_query(latest_run, search_string))
         return result
 
+    async def audited_queries(self):
+        """ (name, collection, filter, sort) for every query of the connector, with values from the db """
+        sample = await self.collection.find_one({}, {"source_id": 1, "search_strings": 1}) or {}
+        source_id = sample.get("source_id", "0")
+        search_strings = sample.get("search_strings") or ["python"]
+        search_string = search_strings if isinstance(search_strings, str) else search_strings[0]
+        run_id = await self.latest_run_id() or 0
+        user = await self.userdata.find_one({}, {"username": 1}) or {}
+        skill_key = {"search_string": search_string, "city": None, "experience": "unknown", 
+                     "day": None, "skill": "Python"}
+
+        return [
+            ("find_item_by_id, set_seen, set_is_archived_true", self.collection, {"source_id": source_id}, None),
+            ("find_known_ids, mark_seen", self.collection, {"source_id": {"$in": [source_id]}}, None),
+            ("load_known_ids", self.collection, {"source_id": {"$gte": ""}}, None),
+            ("grab_for_autosending", self.collection, self.autosending_query(run_id, search_string), None),
+            ("not_scraped_query", self.collection, self.not_scraped_query(run_id), None),
+            ("set_responded", self.collection, {"_id": sample.get("_id")}, None),
+            ("changed since watermark", self.collection, {"updated_at": {"$gt": datetime.utcnow()}}, None),
+            ("latest_run_id", self.runs, {"run_id": {"$exists": True}, "finished_at": {"$ne": None}}, 
+             [("run_id", DESCENDING)]),
+            ("finish_run", self.runs, {"run_id": run_id}, None),
+            ("grab_userdata, update filters", self.userdata, {"username": user.get("username", "")}, None),
+            ("skill index upsert", self.skill_demand, skill_key, None),
+            ("skill index top", self.skill_demand, {"search_string": search_string}, None),
+            ("salary facts of skills", self.db.salary_facts, {"skills": {"$in": ["python"]}}, None),
+            ("salary stats distribution", self.db.salary_stats, 
+             {"skill": "python", "city": "all", "experience": "all", "salary_type": "all"}, None),
+            ("salary stats of skills", self.db.salary_stats, {"skill": {"$in": ["python"]}}, None),
+            ("top paid skills", self.db.salary_stats, 
+             {"city": "all", "experience": "all", "salary_type": "all", "count": {"$gte": 10}}, 
+             [("median", DESCENDING)]),
+        ]
+
+    async def audit_indexes(self, threshold=AUDIT_COLLSCAN_THRESHOLD):
+        """ explain() every query, returns names of queries which scan a big collection """
+        failures = []
+
+        for name, collection, query, sort in await self.audited_queries():
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+
+            plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+            stages = plan_stages(plan)
+            size = await collection.estimated_document_count()
+            failed = "COLLSCAN" in stages and size > threshold
+
+            if failed:
+                failures.append(name)
+
+            logging.log(logging.ERROR if failed else logging.INFO, "%-50s %-14s %8s docs  %s", 
+                        name, collection.name, size, " <- ".join(stages))
+
+        return failures
+
     async def grab_userdata(self, user_id):
         result = await self.userdata.find_one({"username": user_id})
         return result
     
     async def set_responded(self, id, value):
-        await self.collection.update_one({"_id": id}, {"$set": {"responded": value}})
+        await self.collection.update_one({"_id": id}, {"$set": {"responded": value},
+                                                       "$currentDate": {"updated_at": True}})
         logging.info(f"Item {id} responded set to {value}")
 
     async def update_company_filter(self, username, value):
@@ -96,5 +343,254 @@ class MongoConnector:
         logging.info(f"User {username} added {value} to vacancy_blacklist")
     
 
+@dataclass
+class BatchStats:
+    size: int
+    inserted: int
+    matched: int
+    modified: int
+    errors: int
+    seconds: float
+
+
+class BulkVacancyWriter:
+    """
+    Buffers VacancyRAW items and writes them as unordered upserts keyed by source_id.
+    Items are pending from claim() until their batch is written, 
+    search strings of the same vacancy found by other words are merged into the pending item.
+    Buffer is flushed when it reaches `batch_size` items 
+    or when the oldest item waits longer than `flush_interval` seconds.
+    """
+
+    def __init__(self, db_manager: MongoConnector, batch_size=200, flush_interval=5.0):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.oldest = None
+        self.stats = []
+        self.lock = asyncio.Lock()
+        self.timer = None
+        self.pending = {}
+
+    async def start(self):
+        self.timer = asyncio.create_task(self.flush_on_time())
+        return self
+
+    async def flush_on_time(self):
+        while True:
+            await asyncio.sleep(self.flush_interval / 2)
+
+            if self.oldest and time.monotonic() - self.oldest >= self.flush_interval:
+                try:
+                    await self.flush()
+
+                except Exception as exc:
+                    # items are kept in the buffer, the next flush writes them
+                    logging.error("Timed flush failed: %s", exc)
+
+    def claim(self, items):
+        for item in items:
+            self.pending[item.source_id] = item
+
+    def release(self, item):
+        """ item is dropped before writing """
+        self.pending.pop(item.source_id, None)
+
+    def merge_pending(self, ids, search_string):
+        """ returns ids which are pending, search string is added to their items """
+        pending_ids = set()
+
+        for id in ids:
+            item = self.pending.get(id)
+
+            if item is not None:
+                pending_ids.add(id)
+                if search_string not in item.search_strings:
+                    item.search_strings.append(search_string)
+
+        return pending_ids
+
+    async def add(self, item):
+        self.buffer.append(item)
+        
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+        if len(self.buffer) >= self.batch_size:
+            return await self.flush()
+
+    def upsert_operation(self, item):
+        document = item.to_document()
+        # copy, pending item can get new search strings while the batch is sent
+        document["search_strings"] = list(document["search_strings"] or [])
+        # actuality is defined by last_seen_run now
+        document.pop("is_actual")
+
+        # stamped by the server when the batch is written, search strings of known items 
+        # are added by add_search_strings
+        return UpdateOne({"source_id": item.source_id},
+                         {"$setOnInsert": document,
+                          "$set": {"last_seen_run": self.db_manager.run_id},
+                          "$currentDate": {"updated_at": True}},
+                         upsert=True)
+
+    async def flush(self):
+        async with self.lock:
+            if not self.buffer:
+                return None
+
+            batch, self.buffer, self.oldest = self.buffer, [], None
+            start = time.perf_counter()
+            errors = 0
+            # items stay pending while the batch is written, 
+            # search strings merged into them meanwhile are added after the write
+            written = [list(item.search_strings or []) for item in batch]
+            operations = [self.upsert_operation(item) for item in batch]
+
+            for attempt in range(FLUSH_ATTEMPTS):
+                try:
+                    result = await self.db_manager.collection.bulk_write(operations, ordered=False)
+                    details = result.bulk_api_result
+                    break
+
+                except BulkWriteError as exc:
+                    details = exc.details
+                    errors = len(details.get("writeErrors", []))
+                    logging.error("Bulk write finished with %s errors", errors)
+                    break
+
+                except PyMongoError as exc:
+                    # upserts are idempotent, the whole batch can be written again
+                    if attempt + 1 == FLUSH_ATTEMPTS:
+                        self.buffer = batch + self.buffer
+                        self.oldest = time.monotonic()
+                        logging.error("Bulk write of %s items failed, they are kept in the buffer: %s", 
+                                      len(batch), exc)
+                        raise
+
+                    delay = FLUSH_RETRY_DELAY * 2 ** attempt
+                    logging.warning("Bulk write failed (%s), retrying in %.1fs", exc, delay)
+                    await asyncio.sleep(delay)
+
+            for item in batch:
+                self.pending.pop(item.source_id, None)
+
+            await self.index_inserted(batch, details.get("upserted", []), written)
+            await self.add_search_strings(batch, details, written)
+            stats = BatchStats(size=len(batch),
+                               inserted=details.get("nUpserted", 0),
+                               matched=details.get("nMatched", 0),
+                               modified=details.get("nModified", 0),
+                               errors=errors,
+                               seconds=time.perf_counter() - start)
+            self.stats.append(stats)
+            logging.info("Batch of %s items written to db: %s new, %s updated",
+                         stats.size, stats.inserted, stats.modified)
+            return stats
+
+    async def index_inserted(self, batch, upserted, written):
+        """ 
+        only new vacancies are counted in the skill index, upserted has indexes of them in the batch.
+        They are counted with search strings which were written, strings merged later are counted by add_search_strings
+        """
+        try:
+            await self.db_manager.skill_index.add_vacancies(
+                [{**batch[item["index"]].to_document(), "search_strings": written[item["index"]]} 
+                 for item in upserted])
+
+        except Exception as exc:
+            # counters can be restored with skill_index rebuild, items are already stored
+            logging.error("Skill index update failed: %s", exc)
+
+    async def add_search_strings(self, batch, details, written):
+        """ 
+        items which were already stored can bring a new search string, 
+        inserted items can get one while the batch was written, it is added with skill index update
+        """
+        upserted = {item["index"] for item in details.get("upserted", [])}
+        failed = {item["index"] for item in details.get("writeErrors", [])}
+        by_search_string = {}
+
+        for index, item in enumerate(batch):
+            if index in failed:
+                continue
+
+            for search_string in item.search_strings or []:
+                if index not in upserted or search_string not in written[index]:
+                    by_search_string.setdefault(search_string, []).append(item.source_id)
+
+        for search_string, ids in by_search_string.items():
+            await self.db_manager.add_search_string(ids, search_string)
+
+    async def close(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+        await self.flush()
+        logging.info("Bulk writer: %s items in %s batches, %s new",
+                     sum(stats.size for stats in self.stats),
+                     len(self.stats),
+                     sum(stats.inserted for stats in self.stats))
+        return self.stats
+
+
+def plan_stages(plan):
+    """ stages of the winning plan from the root, index names are added to IXSCAN """
+    stages = []
+
+    if "stage" in plan:
+        stages.append(f"{plan['stage']}({plan['indexName']})" if "indexName" in plan else plan["stage"])
+
+    # slot based engine wraps the plan into queryPlan, OR and sort merges have several inputs
+    children = [plan[key] for key in ("queryPlan", "inputStage") if key in plan] + plan.get("inputStages", [])
+
+    for child in children:
+        stages.extend(plan_stages(child))
+
+    return stages
+
+
+async def audit(threshold=AUDIT_COLLSCAN_THRESHOLD, ensure=False):
+    db_manager = MongoConnector()
+
+    try:
+        if ensure:
+            await db_manager.ensure_indexes()
+
+        failures = await db_manager.audit_indexes(threshold)
+
+    finally:
+        await db_manager.close_connection()
+
+    if failures:
+        logging.error("COLLSCAN on collections above %s documents: %s", threshold, ", ".join(failures))
+    return 1 if failures else 0
+
+
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    import sys
+    import argparse
+
+    from rich.logging import RichHandler
+
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    parser = argparse.ArgumentParser(description="explain() every query of MongoConnector")
+    parser.add_argument("command", choices=["audit", "ensure-indexes"])
+    parser.add_argument("--threshold", type=int, default=AUDIT_COLLSCAN_THRESHOLD,
+                        help="collections with more documents must not be scanned")
+    parser.add_argument("--ensure", action="store_true", help="create indexes before the audit")
+    args = parser.parse_args()
+
+    if args.command == "ensure-indexes":
+        async def ensure_indexes():
+            db_manager = MongoConnector()
+            await db_manager.ensure_indexes()
+            await db_manager.close_connection()
+
+        asyncio.run(ensure_indexes())
+    else:
+        sys.exit(asyncio.run(audit(args.threshold, args.ensure)))
\ No newline at end of file
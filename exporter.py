@@ -0,0 +1,273 @@
+"""
+Streaming export of vacancies to Parquet and CSV.
+
+Cursor is read by batches and every batch is written as a separate row group / CSV chunk,
+so memory doesn't grow with the collection.
+Parquet export is a directory of part files with typed columns:
+experience range is two int columns, key_skills are lists, when_scraped and updated_at are timestamps.
+Full export replaces all the parts, incremental export appends a part with documents
+whose updated_at is newer than the watermark of the previous export.
+The same vacancy can be in several parts, the row with the latest updated_at is the actual one.
+updated_at is stamped by mongo, incremental export reads a short overlap before the watermark again
+(MongoConnector.changed_since), so writes which committed late are not lost.
+
+    python exporter.py parquet --output export/vacancies
+    python exporter.py parquet --output export/vacancies --incremental
+    python exporter.py csv --output output.csv
+"""
+import os
+import json
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rich.logging import RichHandler
+
+from db_operations import MongoConnector, UPDATED_AT_OVERLAP
+from models import WHEN_SCRAPED_FORMAT, document_experience, parse_when_scraped
+
+BATCH_SIZE = 5000
+PARQUET_OUTPUT = "export/vacancies"
+CSV_OUTPUT = "output.csv"
+WATERMARK_FILE = "_watermark.json"
+
+EXPORT_SCHEMA = pa.schema([
+    ("source_id", pa.string()),
+    ("title", pa.string()),
+    ("salary_type", pa.string()),
+    ("salary_min", pa.int64()),
+    ("salary_max", pa.int64()),
+    ("salary_currency", pa.string()),
+    ("city", pa.string()),
+    ("experience_min", pa.int32()),
+    ("experience_max", pa.int32()),
+    ("company_name", pa.string()),
+    ("employment_type", pa.string()),
+    ("key_skills", pa.list_(pa.string())),
+    ("extracted_skills", pa.list_(pa.string())),
+    ("search_strings", pa.list_(pa.string())),
+    ("is_archived", pa.bool_()),
+    ("when_scraped", pa.timestamp("ms")),
+    ("updated_at", pa.timestamp("ms")),
+])
+# documents which are not migrated yet keep experience as a list
+EXPORT_PROJECTION = {**{name: 1 for name in EXPORT_SCHEMA.names}, "experience": 1}
+# columns of the old csv_converter output
+CSV_COLUMNS = ["title", "salary_min", "salary_max", "experience", "company_name",
+               "when_scraped", "employment_type", "key_skills"]
+CSV_PROJECTION = {**{column: 1 for column in CSV_COLUMNS}, "experience_min": 1, "experience_max": 1}
+
+
+def as_list(value):
+    """ old documents keep search_strings as a plain string """
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+def as_int(value):
+    return int(value) if value is not None else None
+
+
+def to_row(document):
+    experience_min, experience_max = document_experience(document)
+
+    return {
+        "source_id": document.get("source_id"),
+        "title": document.get("title"),
+        "salary_type": document.get("salary_type"),
+        "salary_min": as_int(document.get("salary_min")),
+        "salary_max": as_int(document.get("salary_max")),
+        "salary_currency": document.get("salary_currency"),
+        "city": document.get("city"),
+        "experience_min": experience_min,
+        "experience_max": experience_max,
+        "company_name": document.get("company_name"),
+        "employment_type": document.get("employment_type"),
+        "key_skills": as_list(document.get("key_skills")),
+        "extracted_skills": as_list(document.get("extracted_skills")),
+        "search_strings": as_list(document.get("search_strings")),
+        "is_archived": document.get("is_archived"),
+        "when_scraped": parse_when_scraped(document.get("when_scraped")),
+        "updated_at": document.get("updated_at"),
+    }
+
+
+def legacy_experience(experience_min, experience_max):
+    """ experience as the old list: (0, 0) - [0], (6, None) - [6], (1, 3) - [1, 3] """
+    if experience_min is None:
+        return None
+
+    if experience_max is None or experience_max == 0:
+        return [experience_min]
+
+    return [experience_min, experience_max]
+
+
+def to_csv_row(document):
+    when_scraped = parse_when_scraped(document.get("when_scraped"))
+    row = {column: document.get(column) for column in CSV_COLUMNS}
+    row["experience"] = legacy_experience(*document_experience(document))
+    row["when_scraped"] = when_scraped.strftime(WHEN_SCRAPED_FORMAT) if when_scraped else None
+    return row
+
+
+def to_record_batch(documents):
+    rows = [to_row(document) for document in documents]
+    return pa.RecordBatch.from_pylist(rows, schema=EXPORT_SCHEMA)
+
+
+async def iter_batches(cursor, batch_size=BATCH_SIZE):
+    batch = []
+
+    async for document in cursor:
+        batch.append(document)
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def read_watermark(output_dir: Path):
+    """ (watermark, recent), recent are {source_id: updated_at} of rows exported inside the overlap """
+    path = output_dir / WATERMARK_FILE
+
+    if not path.exists():
+        return None, {}
+
+    state = json.loads(path.read_text(encoding="utf-8"))
+    watermark = datetime.fromisoformat(state["watermark"]) if state["watermark"] else None
+    return watermark, state.get("recent", {})
+
+
+def write_watermark(output_dir: Path, watermark, rows, recent):
+    path = output_dir / WATERMARK_FILE
+    path.write_text(json.dumps({"watermark": watermark.isoformat() if watermark else None,
+                                "exported_at": datetime.utcnow().isoformat(),
+                                "rows": rows,
+                                "recent": recent}, indent=2), encoding="utf-8")
+
+
+def recent_rows(recent, watermark):
+    """ rows which the next export reads again because of the overlap """
+    if watermark is None:
+        return {}
+
+    since = (watermark - UPDATED_AT_OVERLAP).isoformat()
+    return {source_id: stamp for source_id, stamp in recent.items() if stamp > since}
+
+
+async def export_parquet(db_manager: MongoConnector, output=PARQUET_OUTPUT, incremental=False, batch_size=BATCH_SIZE):
+    """ returns amount of exported rows """
+    output_dir = Path(output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    old_parts = sorted(output_dir.glob("part-*.parquet"))
+    watermark, exported = read_watermark(output_dir) if incremental and old_parts else (None, {})
+
+    if incremental and watermark is None:
+        logging.info("No watermark found, exporting the whole collection")
+
+    part_name = f"part-{datetime.utcnow():%Y%m%dT%H%M%S%f}.parquet"
+    # readers skip files which start with a dot, half written part is never read
+    tmp_path = output_dir / f".{part_name}.tmp"
+    cursor = db_manager.collection.find(db_manager.changed_since(watermark), EXPORT_PROJECTION,
+                                        batch_size=batch_size)
+    rows = 0
+    new_watermark = watermark
+    recent = dict(exported)
+
+    with pq.ParquetWriter(tmp_path, EXPORT_SCHEMA, compression="zstd") as writer:
+        async for documents in iter_batches(cursor, batch_size):
+            # rows of the overlap which were exported last time without changes are skipped
+            documents = [document for document in documents
+                         if not document.get("updated_at")
+                         or exported.get(document.get("source_id")) != document["updated_at"].isoformat()]
+
+            if not documents:
+                continue
+
+            record_batch = to_record_batch(documents)
+            writer.write_batch(record_batch)
+            rows += record_batch.num_rows
+
+            stamps = [document["updated_at"] for document in documents if document.get("updated_at")]
+            if new_watermark:
+                stamps.append(new_watermark)
+            if stamps:
+                new_watermark = max(stamps)
+
+            recent.update((document.get("source_id"), document["updated_at"].isoformat())
+                          for document in documents if document.get("updated_at"))
+            recent = recent_rows(recent, new_watermark)
+
+            logging.info(f"Exported {rows} rows")
+
+    if rows == 0 and watermark is not None:
+        tmp_path.unlink()
+        logging.info("Nothing changed since the last export")
+        return 0
+
+    os.replace(tmp_path, output_dir / part_name)
+
+    if watermark is None:
+        for part in old_parts:
+            part.unlink()
+
+    write_watermark(output_dir, new_watermark, rows, recent)
+    logging.info(f"{rows} rows exported to {output_dir / part_name}")
+    return rows
+
+
+async def export_csv(db_manager: MongoConnector, output=CSV_OUTPUT, batch_size=BATCH_SIZE):
+    """ the old output.csv layout, lists are written as python literals like before """
+    tmp_path = Path(f"{output}.tmp")
+    cursor = db_manager.collection.find({}, CSV_PROJECTION, batch_size=batch_size)
+    rows = 0
+
+    with open(tmp_path, "w", encoding="utf-8", newline="") as file:
+        async for documents in iter_batches(cursor, batch_size):
+            frame = pd.DataFrame([to_csv_row(document) for document in documents], columns=CSV_COLUMNS)
+            # chunks with and without missing salaries must look the same
+            frame[["salary_min", "salary_max"]] = frame[["salary_min", "salary_max"]].astype("Int64")
+            frame.to_csv(file, index=False, header=rows == 0)
+            rows += len(frame)
+
+    os.replace(tmp_path, output)
+    logging.info(f"{rows} rows exported to {output}")
+    return rows
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("format", choices=["parquet", "csv"])
+    parser.add_argument("--output", help=f"default {PARQUET_OUTPUT} for parquet, {CSV_OUTPUT} for csv")
+    parser.add_argument("--incremental", action="store_true", help="export only changed since the last export")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    db_manager = MongoConnector()
+    db_manager.ping()
+
+    try:
+        if args.format == "parquet":
+            await export_parquet(db_manager, args.output or PARQUET_OUTPUT, args.incremental, args.batch_size)
+        else:
+            await export_csv(db_manager, args.output or CSV_OUTPUT, args.batch_size)
+
+    finally:
+        await db_manager.close_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    asyncio.run(main())
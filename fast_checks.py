@@ -0,0 +1,12 @@
+"""
+Quick offline checks: parsers benchmark over benchmarks/corpus compared with benchmarks/baseline.json.
+
+    python fast_checks.py
+    python fast_checks.py --save
+"""
+import sys
+
+from benchmarks.bench_parsers import main
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,176 @@
+"""
+Optional on-disk cache for html_scraper.get_html.
+
+Pages are stored compressed and content-addressed (blob name is sha256 of the page),
+sqlite index maps urls to blobs. Every url class has its own TTL,
+least recently used pages are evicted when cache grows over the size limit.
+
+HTML_CACHE_MODE:
+    off        - cache is not used (default)
+    on         - read fresh pages from cache, save every downloaded page
+    cache-only - never go to network, serve whatever is stored ignoring TTL
+"""
+import os
+import re
+import time
+import zlib
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+CACHE_MODE = os.getenv("HTML_CACHE_MODE", "off")
+CACHE_DIR = os.getenv("HTML_CACHE_DIR", ".cache/html")
+MAX_CACHE_BYTES = int(os.getenv("HTML_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+# SERP pages change fast, vacancy pages are mostly the same for days
+URL_TTLS = [
+    (re.compile(r"/search/vacancy"), 60 * 60),
+    (re.compile(r"/vacancy/\d+"), 7 * 24 * 60 * 60),
+]
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def ttl_for(url):
+    for pattern, ttl in URL_TTLS:
+        if pattern.search(url):
+            return ttl
+    return DEFAULT_TTL
+
+
+class HtmlCache:
+
+    def __init__(self, directory=CACHE_DIR, mode=CACHE_MODE, max_bytes=MAX_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.mode in ("on", "cache-only")
+
+    @property
+    def cache_only(self):
+        return self.mode == "cache-only"
+
+    def connect(self):
+        if self.connection is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.directory / "index.sqlite", check_same_thread=False)
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+                CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest);
+            """)
+        return self.connection
+
+    def blob_path(self, digest):
+        return self.directory / "blobs" / digest[:2] / (digest + ".zz")
+
+    def get_sync(self, url):
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT digest, stored_at FROM pages WHERE url = ?", (url,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            digest, stored_at = row
+
+            if not self.cache_only and time.time() - stored_at > ttl_for(url):
+                self.misses += 1
+                return None
+
+            try:
+                html = zlib.decompress(self.blob_path(digest).read_bytes()).decode("utf-8")
+            except (OSError, zlib.error):
+                connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+                connection.commit()
+                self.misses += 1
+                return None
+
+            connection.execute("UPDATE pages SET last_access = ? WHERE url = ?", (time.time(), url))
+            connection.commit()
+            self.hits += 1
+            return html
+
+    def put_sync(self, url, html):
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+
+        with self.lock:
+            connection = self.connect()
+
+            if not path.exists():
+                compressed = zlib.compress(data, 6)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(compressed)
+                connection.execute("INSERT OR REPLACE INTO blobs (digest, size) VALUES (?, ?)",
+                                   (digest, len(compressed)))
+
+            now = time.time()
+            connection.execute("INSERT OR REPLACE INTO pages (url, digest, stored_at, last_access) "
+                               "VALUES (?, ?, ?, ?)", (url, digest, now, now))
+            connection.commit()
+            self.evict(connection)
+
+    def evict(self, connection):
+        """ drop least recently used pages until cache fits into max_bytes """
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+        if total <= self.max_bytes:
+            return
+
+        rows = connection.execute("SELECT url, digest FROM pages ORDER BY last_access").fetchall()
+
+        for url, digest in rows:
+            if total <= self.max_bytes * 0.9:
+                break
+
+            connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+            still_used = connection.execute("SELECT 1 FROM pages WHERE digest = ? LIMIT 1",
+                                            (digest,)).fetchone()
+            if still_used:
+                continue
+
+            size = connection.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self.blob_path(digest).unlink(missing_ok=True)
+            total -= size[0] if size else 0
+
+        connection.commit()
+        logging.info("Html cache evicted down to %.1f MB", total / 1024 / 1024)
+
+    async def get(self, url):
+        return await asyncio.to_thread(self.get_sync, url)
+
+    async def put(self, url, html):
+        await asyncio.to_thread(self.put_sync, url, html)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+        if self.enabled:
+            logging.info("Html cache: %s hits, %s misses", self.hits, self.misses)
+
+
+html_cache = HtmlCache()
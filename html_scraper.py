@@ -1,83 +1,172 @@
+import time
+import asyncio
 import logging
+from collections import Counter
 
-import httpx
-import playwright
-
-from headers import headers
-from tools import proxy_gen, playwright_proxy_gen
+from tools import proxy_scheduler, playwright_proxy_scheduler, proxy_label
 from automated_browser import scrape_html
+from html_cache import html_cache
+from http_clients import client_registry
+from retry import (RetryPolicy, CircuitBreaker, FetchError, classify_error, 
+                   ESCALATION, ESCALATE_AT_ONCE, NOT_RETRIED, NOT_FOUND, TRANSPORT_ERRORS, FETCH_EXCEPTIONS, 
+                   PROXY, EMPTY)
+from response_classifier import (FetchedPage, classify_response, classification_stats, 
+                                 USABLE, ERROR_KINDS)
+
 
-async def get_html_httpx(url, semaphore):
+async def get_html_httpx(url, semaphore, proxy=None):
+    """ get page with pooled httpx client, raises FetchError or httpx errors """
+    if proxy is None:
+        proxy = proxy_scheduler.acquire()
 
-    proxy = next(proxy_gen) 
+    client = client_registry.get_client(proxy)
+    
     async with semaphore:
-        async with httpx.AsyncClient(headers=headers, proxies=proxy) as client:
-            try:
-                response = await client.get(url, timeout=60, follow_redirects=True)
-                return response.text
-
-            except (httpx.ConnectTimeout,
-                    httpx.ReadTimeout,
-                    httpx.ConnectError,
-                    httpx.ReadError):
-                
-                logging.warning("Connection error, retrying request")
-                return None
-            
-            except httpx.ProxyError:
-                
-                logging.warning("Proxy error when getting page urls")
-                return None
-                    
-            except Exception as exc:
-                logging.warning("Exception when scraping pages : %s", exc)
-                return None
+        response = await client.get(url)
 
+    if response.status_code == 407:
+        raise FetchError(PROXY, "Proxy authentication required")
 
-async def get_html(url, parameter, semaphore, attempts=11):
-    
-    if parameter == "httpx":
+    return FetchedPage(response.text, response.status_code, dict(response.headers))
 
-        html = await get_html_httpx(url, semaphore)
-        
-        if not html:
-            if attempts > 0:
-                logging.warning("Retrying request")
-                return await get_html(url, parameter, semaphore, attempts - 1)
-            
-        else:
-            return html        
 
+TRANSPORTS = {
+    "httpx": {"fetcher": get_html_httpx, "scheduler": proxy_scheduler},
+    "browser": {"fetcher": scrape_html, "scheduler": playwright_proxy_scheduler},
+}
+
+retry_policy = RetryPolicy()
+circuit_breaker = CircuitBreaker()
+browser_semaphore = asyncio.Semaphore(10)
+# (label, transport) -> pages received, label "escalated" counts pages which needed next transport
+fetch_stats = Counter()
 
-    elif parameter == "browser":
-        try:
-            html = await scrape_html(url, semaphore)
-        
-        except playwright._impl._errors.TimeoutError:
-            if attempts > 0:
-                logging.warning("Retrying request")
-                return await get_html(url, parameter, semaphore, attempts - 1)
 
-            else:
+def escalation_report(label):
+    total = sum(count for (stats_label, _), count in fetch_stats.items() if stats_label == label)
+    escalated = fetch_stats[(label, "escalated")]
+    served = {transport: count for (stats_label, transport), count in fetch_stats.items() 
+              if stats_label == label and transport != "escalated"}
+    return f"{label}: {escalated} of {total - escalated} pages needed escalation, served by {served}"
+
+
+async def fetch_with_retries(url, transport, semaphore, page_kind=None, can_escalate=False):
+    """ 
+    proxies health is tracked by the scheduler, circuit breaker watches the whole transport
+    and counts only faults of the transport itself.
+    Every received page is labeled by response_classifier, unusable labels become FetchError.
+    Open circuit is skipped when there is a next transport, otherwise the call waits until it is half-open.
+    """
+    fetcher, scheduler = TRANSPORTS[transport]["fetcher"], TRANSPORTS[transport]["scheduler"]
+    breaker_key = ("transport", transport)
+
+    for attempt in range(retry_policy.attempts):
+        while not circuit_breaker.allow(breaker_key):
+            if can_escalate:
+                logging.warning("Circuit for %s is open, skipping it", transport)
                 return None
+
+            wait = circuit_breaker.retry_after(breaker_key)
+            logging.warning("Circuit for %s is open, waiting %.1fs", transport, wait)
+            await asyncio.sleep(wait)
+
+        proxy = scheduler.acquire()
+        start = time.perf_counter()
+
+        try:
+            page = await fetcher(url, semaphore, proxy)
+
+            if not page.html:
+                raise FetchError(EMPTY, "Empty page received")
+
+            label = classify_response(page.status, page.headers, page.html, page_kind)
+            classification_stats.record(label, transport, proxy_label(proxy))
+
+            if label not in USABLE:
+                raise FetchError(ERROR_KINDS[label], f"Page is {label}")
+
+            circuit_breaker.record_success(breaker_key)
+            scheduler.report(proxy, "ok", time.perf_counter() - start)
+            return page.html
         
-        except playwright._impl._errors.Error:
-            if attempts > 0:
-                logging.warning("Retrying request")
-                return await get_html(url, parameter, semaphore, attempts - 1)
+        except FETCH_EXCEPTIONS as exc:
+            kind = classify_error(exc)
+            scheduler.report(proxy, kind, time.perf_counter() - start)
 
-            else:
-                return None
-            
-        if not html:
-            if attempts > 0:
-                logging.warning("Retrying request")
-                return await get_html(url, parameter, semaphore, attempts - 1)
+            if kind in NOT_RETRIED:
+                # next transports won't find the page either
+                raise FetchError(kind, f"Page {url} is {kind}") from exc
+
+            if kind in TRANSPORT_ERRORS:
+                circuit_breaker.record_failure(breaker_key)
+
+            if attempt + 1 == retry_policy.attempts:
+                logging.warning("%s error (%s) for %s, no attempts left", transport, kind, url)
+                break
+
+            if kind in ESCALATE_AT_ONCE and can_escalate:
+                logging.warning("%s page for %s is %s, escalating", transport, url, kind)
+                break
 
-        else:
-            return html        
+            delay = retry_policy.delay(attempt, kind)
+            logging.warning("%s error (%s) for %s, attempt %s, retrying in %.1fs", 
+                            transport, kind, url, attempt + 1, delay)
+            await asyncio.sleep(delay)
 
+    return None
+
+
+async def get_html(url, parameter, semaphore, page_kind=None, raise_not_found=False, use_cache=True):
+    """
+    parameter - "httpx", "browser" or "auto".
+    "auto" tries transports from ESCALATION one after another,
+    browser gets its own semaphore in this case.
+    page_kind - "serp" or "vacancy", enables content checks of response_classifier,
+    it is also the name of pages group in fetch_stats.
+    raise_not_found - FetchError is raised for 404 and 410 pages instead of returning None.
+    use_cache - stored page can be returned, status checks need a fresh one unless cache-only mode is on.
+    """
+    label = page_kind or "page"
+
+    if parameter == "auto":
+        transports = [(transport, semaphore if transport == "httpx" else browser_semaphore)
+                      for transport in ESCALATION]
+
+    elif parameter in TRANSPORTS:
+        transports = [(parameter, semaphore)]
         
     else:
         logging.error("Invalid parameter for html scraping")
-        return None
\ No newline at end of file
+        return None
+
+    if html_cache.cache_only or (html_cache.enabled and use_cache):
+        html = await html_cache.get(url)
+
+        if html or html_cache.cache_only:
+            return html
+
+    for index, (transport, transport_semaphore) in enumerate(transports):
+        can_escalate = index + 1 < len(transports)
+        try:
+            html = await fetch_with_retries(url, transport, transport_semaphore, page_kind, can_escalate)
+
+        except FetchError as exc:
+            logging.warning(str(exc))
+
+            if raise_not_found and exc.kind == NOT_FOUND:
+                raise
+            return None
+
+        if html:
+            fetch_stats[(label, transport)] += 1
+
+            if index > 0:
+                fetch_stats[(label, "escalated")] += 1
+
+            if html_cache.enabled:
+                await html_cache.put(url, html)
+            return html
+        
+        logging.warning("No html received with %s", transport)
+
+    return None
@@ -0,0 +1,74 @@
+"""
+Long-lived httpx clients of html_scraper, one per proxy.
+Module doesn't import proxies, so clients can be used offline, e.g. by benchmarks.
+"""
+import logging
+
+import httpx
+
+from headers import headers
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30
+REQUEST_TIMEOUT = 60
+
+
+def proxy_key(proxy):
+    """ hashable key for httpx proxies mapping """
+    if not proxy:
+        return None
+    return tuple(sorted(proxy.items()))
+
+
+class ClientRegistry:
+    """
+    Long-lived httpx clients, one per proxy.
+    Keeps connections alive between requests so every vacancy page 
+    doesn't cost a new TCP and TLS handshake through the proxy.
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, 
+                 max_keepalive=MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=KEEPALIVE_EXPIRY,
+                 http2=False):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        
+        if http2 and not HTTP2_AVAILABLE:
+            logging.warning("h2 package is not installed, falling back to HTTP/1.1")
+        
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.clients = {}
+
+    def get_client(self, proxy=None):
+        key = proxy_key(proxy)
+        client = self.clients.get(key)
+
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(headers=headers, 
+                                       proxies=proxy,
+                                       limits=self.limits,
+                                       http2=self.http2,
+                                       timeout=REQUEST_TIMEOUT,
+                                       follow_redirects=True)
+            self.clients[key] = client
+
+        return client
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        
+        self.clients = {}
+        logging.info("HTTP clients closed")
+
+
+client_registry = ClientRegistry()
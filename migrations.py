@@ -0,0 +1,340 @@
+"""
+Resumable batch migrations of the vacancies collection.
+
+Documents matching migration query are walked in _id order by batches.
+Migration either has `update` - update document or aggregation pipeline which is applied
+on the server to the whole _id range of a batch with one update_many,
+or `transform` - function (or coroutine function) which gets a batch of documents
+and returns bulk_write operations.
+Last processed _id is saved in the migrations collection after every batch,
+so interrupted migration continues from the same place.
+Repeatable migrations change documents so they don't match the query anymore,
+finished repeatable migration starts a new pass for documents stored after it.
+
+    python migrations.py salary_currency
+    python migrations.py salary_bounds --restart
+    python migrations.py rename_key --old search_string --new search_strings
+    python migrations.py vacancy_layout
+    python migrations.py deduplicate
+"""
+import re
+import time
+import inspect
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import pandas as pd
+from rich.logging import RichHandler
+from pymongo import UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError
+
+from db_operations import MongoConnector
+from currency_rates import rates_provider
+from salary import normalize_salaries, CURRENCIES, DEFAULT_CURRENCY
+from models import WHEN_SCRAPED_FORMAT
+
+BATCH_SIZE = 1000
+
+
+@dataclass
+class Migration:
+    name: str
+    query: dict
+    update: Optional[object] = None
+    transform: Optional[Callable] = None
+    projection: Optional[dict] = None
+    batch_size: int = BATCH_SIZE
+    # done documents don't match the query, finished migration runs again for new documents
+    repeatable: bool = False
+
+
+class MigrationRunner:
+
+    def __init__(self, db_manager: MongoConnector):
+        self.db_manager = db_manager
+        self.collection = db_manager.collection
+        self.checkpoints = db_manager.db.migrations
+
+    async def load_checkpoint(self, migration: Migration, restart=False):
+        if restart:
+            await self.checkpoints.delete_one({"_id": migration.name})
+
+        checkpoint = await self.checkpoints.find_one({"_id": migration.name})
+
+        if checkpoint is None:
+            checkpoint = {"_id": migration.name, "last_id": None, "processed": 0, "modified": 0,
+                          "started_at": datetime.utcnow(), "finished_at": None}
+            await self.checkpoints.insert_one(checkpoint)
+
+        return checkpoint
+
+    async def save_checkpoint(self, name, last_id, processed, modified, finished=False):
+        await self.checkpoints.update_one({"_id": name},
+                                          {"$set": {"last_id": last_id,
+                                                    "processed": processed,
+                                                    "modified": modified,
+                                                    "updated_at": datetime.utcnow(),
+                                                    "finished_at": datetime.utcnow() if finished else None}})
+
+    async def next_batch(self, migration: Migration, last_id):
+        query = dict(migration.query)
+
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        # update on the server needs only the _id range of the batch
+        projection = {"_id": 1} if migration.update is not None else migration.projection
+        cursor = self.collection.find(query, projection).sort("_id", ASCENDING).limit(migration.batch_size)
+        return await cursor.to_list(length=migration.batch_size)
+
+    async def apply_batch(self, migration: Migration, batch, last_id):
+        """ returns amount of modified documents """
+        if migration.update is not None:
+            batch_range = {"$lte": batch[-1]["_id"]}
+
+            if last_id is not None:
+                batch_range["$gt"] = last_id
+
+            result = await self.collection.update_many({**migration.query, "_id": batch_range}, migration.update)
+            return result.modified_count
+
+        operations = migration.transform(batch)
+
+        if inspect.isawaitable(operations):
+            operations = await operations
+
+        if not operations:
+            return 0
+
+        try:
+            result = await self.collection.bulk_write(operations, ordered=False)
+            return result.modified_count
+
+        except BulkWriteError as exc:
+            logging.error("Migration %s: %s write errors in batch",
+                          migration.name, len(exc.details.get("writeErrors", [])))
+            return exc.details.get("nModified", 0)
+
+    async def run(self, migration: Migration, restart=False):
+        checkpoint = await self.load_checkpoint(migration, restart)
+
+        if checkpoint["finished_at"] and migration.repeatable:
+            logging.info("Migration %s was finished at %s, looking for new documents",
+                         migration.name, checkpoint["finished_at"])
+            checkpoint.update(last_id=None, processed=0, modified=0)
+
+        elif checkpoint["finished_at"]:
+            logging.info("Migration %s is already finished at %s, use restart to run it again",
+                         migration.name, checkpoint["finished_at"])
+            return checkpoint
+
+        last_id, processed, modified = checkpoint["last_id"], checkpoint["processed"], checkpoint["modified"]
+
+        if last_id is not None:
+            logging.info("Migration %s resumed after %s processed documents", migration.name, processed)
+
+        start = time.perf_counter()
+        processed_now = 0
+
+        while True:
+            batch = await self.next_batch(migration, last_id)
+
+            if not batch:
+                break
+
+            modified += await self.apply_batch(migration, batch, last_id)
+            last_id = batch[-1]["_id"]
+            processed += len(batch)
+            processed_now += len(batch)
+            await self.save_checkpoint(migration.name, last_id, processed, modified)
+
+            elapsed = time.perf_counter() - start
+            logging.info("Migration %s: %s processed, %s modified, %.0f docs/sec",
+                         migration.name, processed, modified, processed_now / elapsed if elapsed else 0)
+
+        await self.save_checkpoint(migration.name, last_id, processed, modified, finished=True)
+        elapsed = time.perf_counter() - start
+        logging.info("Migration %s finished: %s processed, %s modified in %.1fs (%.0f docs/sec)",
+                     migration.name, processed, modified, elapsed, processed_now / elapsed if elapsed else 0)
+        return await self.checkpoints.find_one({"_id": migration.name})
+
+# ===================================== MIGRATIONS =====================================
+
+
+def to_python(value):
+    return None if pd.isna(value) else value
+
+
+def normalized_salaries(batch):
+    """ salary fields of the batch documents parsed by salary.normalize_salaries """
+    salaries = normalize_salaries(pd.Series([document.get("salary") for document in batch], dtype=object))
+    return [{column: to_python(value) for column, value in row.items()}
+            for row in salaries.astype(object).to_dict("records")]
+
+
+def salary_bounds_operations(batch):
+    return [UpdateOne({"_id": document["_id"]},
+                      {"$set": {"salary_min": row["salary_min"], "salary_max": row["salary_max"]},
+                       "$currentDate": {"updated_at": True}})
+            for document, row in zip(batch, normalized_salaries(batch))]
+
+
+def salary_bounds():
+    """ salary_min and salary_max in rubles for documents stored before they were parsed """
+    return Migration("salary_bounds",
+                     query={"salary_min": {"$exists": False}},
+                     transform=salary_bounds_operations,
+                     projection={"salary": 1},
+                     repeatable=True)
+
+
+def salary_currency():
+    """ currency is detected by its symbol on the server, documents are not sent to the client """
+    salary = {"$ifNull": ["$salary", ""]}
+    branches = [{"case": {"$regexMatch": {"input": salary, "regex": re.escape(symbol)}}, "then": code}
+                for code, symbol in CURRENCIES.items()]
+
+    return Migration("salary_currency",
+                     query={"salary_currency": {"$exists": False}},
+                     update=[{"$set": {"salary_currency": {"$switch": {"branches": branches,
+                                                                       "default": DEFAULT_CURRENCY}},
+                                       "updated_at": "$$NOW"}}],
+                     repeatable=True)
+
+
+def rename_key(old_key, new_key):
+    """ renamed by the server, nothing is sent to the client except _id of batches """
+    return Migration(f"rename_key:{old_key}:{new_key}",
+                     query={old_key: {"$exists": True}},
+                     update={"$rename": {old_key: new_key}, "$currentDate": {"updated_at": True}},
+                     repeatable=True)
+
+
+def vacancy_layout():
+    """ experience list becomes experience_min / experience_max, when_scraped string becomes a date, on the server """
+    experience = {"$ifNull": ["$experience", []]}
+    first = {"$arrayElemAt": [experience, 0]}
+    experience_max = {"$switch": {"branches": [{"case": {"$eq": [{"$size": experience}, 2]},
+                                                "then": {"$arrayElemAt": [experience, 1]}},
+                                               {"case": {"$eq": [first, 0]}, "then": 0}],
+                                  "default": None}}
+    when_scraped = {"$cond": [{"$eq": [{"$type": "$when_scraped"}, "string"]},
+                              {"$dateFromString": {"dateString": "$when_scraped",
+                                                   # python and mongo use the same specifiers here
+                                                   "format": WHEN_SCRAPED_FORMAT,
+                                                   "onError": None}},
+                              "$when_scraped"]}
+
+    return Migration("vacancy_layout",
+                     query={"$or": [{"experience": {"$exists": True}}, {"when_scraped": {"$type": "string"}}]},
+                     update=[{"$set": {"experience_min": {"$ifNull": [first, None]},
+                                       "experience_max": experience_max,
+                                       "when_scraped": when_scraped,
+                                       "updated_at": "$$NOW"}},
+                             {"$unset": "experience"}],
+                     repeatable=True)
+
+
+def keeper_order(document):
+    """ the most recently seen copy is kept """
+    return (document.get("last_seen_run") or 0, document.get("updated_at") or datetime.min, document["_id"])
+
+
+def as_list(search_strings):
+    if isinstance(search_strings, str):
+        return [search_strings]
+    return list(search_strings or [])
+
+
+async def deduplicate_source_ids(db_manager: MongoConnector):
+    """
+    Vacancies stored several times by old races are merged before the unique source_id index is built.
+    The most recently seen copy is kept, search strings and responded flag of the other copies are merged into it.
+    Skill index counted every copy, it is rebuilt if anything is removed. Returns amount of removed copies.
+    """
+    collection = db_manager.collection
+    duplicates = collection.aggregate([
+        {"$group": {"_id": "$source_id", "copies": {"$sum": 1}}},
+        {"$match": {"copies": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    removed = 0
+
+    async for group in duplicates:
+        copies = await collection.find({"source_id": group["_id"]}).to_list(length=None)
+        keeper = max(copies, key=keeper_order)
+        others = [copy["_id"] for copy in copies if copy["_id"] != keeper["_id"]]
+        search_strings = list(dict.fromkeys(search_string for copy in copies
+                                            for search_string in as_list(copy.get("search_strings"))))
+
+        await collection.update_one({"_id": keeper["_id"]},
+                                    {"$set": {"search_strings": search_strings,
+                                              "responded": any(copy.get("responded") for copy in copies)},
+                                     "$currentDate": {"updated_at": True}})
+        result = await collection.delete_many({"_id": {"$in": others}})
+        removed += result.deleted_count
+
+    if removed:
+        logging.warning("Removed %s duplicate vacancies", removed)
+        await db_manager.skill_index.rebuild(collection)
+
+    return removed
+
+
+async def run_migration(migration: Migration, restart=False):
+    db_manager = MongoConnector()
+
+    try:
+        await rates_provider.load()
+        return await MigrationRunner(db_manager).run(migration, restart)
+
+    finally:
+        await db_manager.close_connection()
+
+
+async def run_deduplication():
+    db_manager = MongoConnector()
+
+    try:
+        # duplicates are merged before the unique index is built
+        await db_manager.ensure_source_id_index()
+
+    finally:
+        await db_manager.close_connection()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("migration", choices=["salary_bounds", "salary_currency", "rename_key",
+                                                        "vacancy_layout", "deduplicate"])
+    parser.add_argument("--old", help="old key for rename_key")
+    parser.add_argument("--new", help="new key for rename_key")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="forget checkpoint and start from the beginning")
+    args = parser.parse_args(argv)
+
+    if args.migration == "deduplicate":
+        asyncio.run(run_deduplication())
+        return
+
+    if args.migration == "rename_key":
+        if not (args.old and args.new):
+            parser.error("rename_key needs --old and --new")
+        migration = rename_key(args.old, args.new)
+
+    else:
+        migration = {"salary_bounds": salary_bounds, "salary_currency": salary_currency,
+                     "vacancy_layout": vacancy_layout}[args.migration]()
+
+    migration.batch_size = args.batch_size
+    asyncio.run(run_migration(migration, args.restart))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    main()
@@ -1,63 +1,133 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+from datetime import datetime
 from typing import Optional
 
-@dataclass
+# old documents keep when_scraped as a string in this format
+WHEN_SCRAPED_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+
+def experience_range(experience):
+    """ old list layout to (experience_min, experience_max): [0] - (0, 0), [6] - (6, None), [1, 3] - (1, 3) """
+    if not experience:
+        return None, None
+
+    if len(experience) == 2:
+        return int(experience[0]), int(experience[1])
+
+    return (0, 0) if experience[0] == 0 else (int(experience[0]), None)
+
+
+def document_experience(document):
+    """ (experience_min, experience_max) of a stored document of any layout """
+    if "experience_min" not in document and "experience" in document:
+        return experience_range(document["experience"])
+
+    return document.get("experience_min"), document.get("experience_max")
+
+
+def parse_when_scraped(value):
+    if value is None or isinstance(value, datetime):
+        return value
+
+    try:
+        return datetime.strptime(value, WHEN_SCRAPED_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def with_codec(cls):
+    """
+    to_document and _decode are compiled once from the field list,
+    so serialisation is one dict display and one constructor call without loops over fields().
+    """
+    names = [item.name for item in fields(cls)]
+    stored = [name for name in names if name != "_id"]
+    source = (
+        "def to_document(self):\n"
+        f"    return {{{', '.join(f'{name!r}: self.{name}' for name in stored)}}}\n"
+        "def _decode(cls, document):\n"
+        "    get = document.get\n"
+        f"    return cls({', '.join(f'{name}=get({name!r})' for name in names)})\n"
+    )
+    namespace = {}
+    exec(source, {}, namespace)
+    cls.to_document = namespace["to_document"]
+    cls._decode = classmethod(namespace["_decode"])
+    return cls
+
+
+@with_codec
+@dataclass(slots=True)
 class VacancyRAW:
-    
+
     # Название должности
-    title: str
-    # 5 типов зп: 
+    title: Optional[str]
+    # 5 типов зп:
     # 1. По договоренности - "no numbers"
     # 2. Вилка "fork"
     # 3. Одно число "fixed"
     # 4. от "min"
     # 5. до "max"
-    salary_type: str
+    salary_type: Optional[str]
     # Значение в поле для зарплаты в виде строки
-    salary: str
+    salary: Optional[str]
     # Значение минимальной зп
-    salary_min: int
+    salary_min: Optional[int]
     # Значение максимальной зп
-    salary_max: int
+    salary_max: Optional[int]
     # url на страницу вакансии
-    url: str
+    url: Optional[str]
     # Город вакансии
-    city: str
-    # Требуемый опыт работы храним в словаре
-    # [0] - без опыта
-    # [5] - 5 лет
-    # [1, 3] - от 1 до 3 лет
-    experience: list
+    city: Optional[str]
+    # Требуемый опыт работы в годах
+    # 0, 0 - без опыта
+    # 6, None - более 6 лет
+    # 1, 3 - от 1 до 3 лет
+    experience_min: Optional[int]
+    experience_max: Optional[int]
     # Если в карточке есть "Откликнитесь среди первых" - True, иначе False
     fresh: bool
     # Значит что вакансия актуальна и не в архиве
     is_actual: bool
     # Название компании
-    company_name: str
+    company_name: Optional[str]
     # url страницы компании
-    company_page: str
+    company_page: Optional[str]
     # Строка с помощью которой велся поиск
     search_strings: list
-    # Дата когда соскребли данные
-    when_scraped: str
+    # Когда соскребли данные
+    when_scraped: Optional[datetime]
     # Адрес компании
-    company_address: str
+    company_address: Optional[str]
     # Описание вакансии
-    description: str
+    description: Optional[str]
     # Тип занятости
-    employment_type: str
+    employment_type: Optional[str]
     # айди вакансии
     source_id: str
     # Ключевые навыки, если нет то пустой сет
-    key_skills: list
+    key_skills: Optional[list]
     # Спаршена ли страница вакансии
-    is_scraped: bool
+    is_scraped: Optional[bool]
     # Находится ли страница вакансии в архиве
     is_archived: bool
     # Ответил ли я на вакансию
     responded: bool
     # Валюта зп
-    salary_currency: str =  field(default=None)
+    salary_currency: Optional[str] = field(default=None)
+    # "net" - на руки, "gross" - до вычета налогов, None если не указано
+    salary_tax: Optional[str] = field(default=None)
+    # Навыки найденные в описании по skills.txt
+    extracted_skills: Optional[list] = field(default=None)
     # айди от монго
-    _id: str = field(default=None)
+    _id: Optional[object] = field(default=None)
+
+    @classmethod
+    def from_document(cls, document: dict) -> "VacancyRAW":
+        """ missing fields are None, documents of the old layout are converted on the fly """
+        if "experience" in document or isinstance(document.get("when_scraped"), str):
+            document = dict(document)
+            document["experience_min"], document["experience_max"] = document_experience(document)
+            document["when_scraped"] = parse_when_scraped(document.get("when_scraped"))
 
+        return cls._decode(document)
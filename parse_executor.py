@@ -0,0 +1,124 @@
+"""
+Runs selectolax parsing out of the event loop.
+
+In "process" mode raw html bytes are sent to a ProcessPoolExecutor
+and workers return plain records (dicts, ints, bools),
+so parsing of big pages uses all cores while the loop keeps doing I/O.
+In "inline" mode parsers are called directly, like before.
+
+PARSE_EXECUTOR - "process" (default) or "inline"
+PARSE_WORKERS  - amount of worker processes, cpu count by default
+
+Crawlers send every page on its own as soon as it is fetched, parse stage has a worker per process.
+map() is for batches which are already in memory, like descriptions of a migration batch.
+"""
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from models import VacancyRAW
+from currency_rates import rates_provider
+
+PARSE_MODE = os.getenv("PARSE_EXECUTOR", "process")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count()
+# forkserver is not available on windows
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# ===================================== WORKER SIDE =====================================
+# parsers are imported inside functions, validator and afterscraper import this module
+
+
+def init_worker(rates):
+    # workers use rates of the parent process and never go to the currency api
+    rates_provider.remember(rates)
+
+
+def serp_page_records(html: bytes, search_string: str) -> list:
+    from parsers import parse_serp_page
+    return [item.to_document() for item in parse_serp_page(html, search_string) if item]
+
+
+def pagination_record(html: bytes) -> int:
+    from parsers import parse_pagination
+    return parse_pagination(html)
+
+
+def vacancy_details_record(html: bytes) -> dict:
+    from parsers import parse_vacancy_details
+    return parse_vacancy_details(html)
+
+
+def archived_record(html: bytes) -> bool:
+    from parsers import detect_is_archived
+    return detect_is_archived(html)
+
+
+def run_chunk(func, chunk):
+    return [func(*args) for args in chunk]
+
+# ===================================== LOOP SIDE =====================================
+
+
+def to_bytes(html):
+    return html.encode("utf-8") if isinstance(html, str) else html
+
+
+class ParseExecutor:
+
+    def __init__(self, mode=PARSE_MODE, workers=PARSE_WORKERS):
+        self.mode = mode
+        self.workers = workers
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            # pool starts when motor, playwright and to_thread threads already run,
+            # forking a process with threads can deadlock the child
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context(START_METHOD),
+                                            initializer=init_worker,
+                                            initargs=(rates_provider.get_rates(),))
+            logging.info("Parse pool started with %s workers", self.workers)
+        return self.pool
+
+    async def run(self, func, *args):
+        if self.mode != "process":
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_pool(), func, *args)
+
+    async def map(self, func, args_list):
+        """ run func over a batch, every worker gets one chunk of it """
+        if self.mode != "process":
+            return [func(*args) for args in args_list]
+
+        loop = asyncio.get_running_loop()
+        chunksize = max(1, -(-len(args_list) // self.workers))
+        chunks = [args_list[i:i + chunksize] for i in range(0, len(args_list), chunksize)]
+        results = await asyncio.gather(*[loop.run_in_executor(self.get_pool(), run_chunk, func, chunk)
+                                         for chunk in chunks])
+        return [result for chunk in results for result in chunk]
+
+    async def serp_page(self, html, search_string):
+        records = await self.run(serp_page_records, to_bytes(html), search_string)
+        return [VacancyRAW.from_document(record) for record in records]
+
+    async def pagination(self, html):
+        return await self.run(pagination_record, to_bytes(html))
+
+    async def vacancy_details(self, html):
+        return await self.run(vacancy_details_record, to_bytes(html))
+
+    async def is_archived(self, html):
+        return await self.run(archived_record, to_bytes(html))
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+parse_executor = ParseExecutor()
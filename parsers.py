@@ -1,19 +1,19 @@
 import re
-import asyncio
 import logging
 import hashlib
 import unicodedata
 from urllib.parse import urljoin, urlparse, parse_qs
 from datetime import datetime
+from dataclasses import dataclass
 
 from rich import print
 from selectolax.parser import HTMLParser, Selector
 
-from models import VacancyRAW
-from transformator import detect_currency, split_salary, convert_currency, get_currency_rates
+from models import VacancyRAW, experience_range
+from salary import parse_salary, convert_currency
+from skill_extractor import extract_skills
 
 VACANCY_BASE_URL = "https://hh.ru/vacancy/"
-rates = asyncio.run(get_currency_rates())
 
 def generate_pages(url: str, pages_amount: int, searched_string: str):
     pages = []
@@ -24,58 +24,103 @@ def generate_pages(url: str, pages_amount: int, searched_string: str):
     return pages
 
 
-def parse_title(selector: Selector):
-    title_selector = selector.css_first("span.serp-item__title")
-    
-    if title_selector:
-        raw_title = title_selector.text()
-        title = unicodedata.normalize('NFKD', raw_title)\
-        .encode().decode('utf-8')
-        
-        return title
-    
-    else:
-        logging.warning("No title found")
-        return None
+@dataclass(frozen=True)
+class FieldSpec:
+    """ 
+    Field of SERP item. Node is matched by tag and data-qa value or by class token,
+    value is node text or one of its attributes.
+    """
+    name: str
+    tag: str
+    data_qa: str = None
+    css_class: str = None
+    attribute: str = None
+
+
+SERP_ITEM_FIELDS = (
+    FieldSpec("title", "span", css_class="serp-item__title"),
+    FieldSpec("salary", "span", data_qa="vacancy-serp__vacancy-compensation"),
+    FieldSpec("response_url", "a", data_qa="vacancy-serp__vacancy_response", attribute="href"),
+    FieldSpec("city", "div", data_qa="vacancy-serp__vacancy-address"),
+    FieldSpec("experience", "div", data_qa="vacancy-serp__vacancy-work-experience"),
+    FieldSpec("fresh", "span", data_qa="vacancy-label-be-first"),
+    FieldSpec("company_name", "a", data_qa="vacancy-serp__vacancy-employer"),
+    FieldSpec("company_page", "a", data_qa="vacancy-serp__vacancy-employer", attribute="href"),
+)
+
+
+class FieldExtractor:
+    """
+    Collects all the fields of an item in one walk over its nodes
+    instead of a separate css query for every field.
+    First matched node wins, like css_first does, its children are not visited.
+    """
 
+    def __init__(self, specs):
+        self.specs = specs
+        self.by_data_qa = {}
+        self.by_class = {}
 
-def parse_salary(selector: Selector):
-    salary_selector = selector.css_first("span[data-qa='vacancy-serp__vacancy-compensation']")
-    
-    if salary_selector:
-        
-        raw_salary = salary_selector.text()
-        salary = unicodedata.normalize('NFKD', raw_salary)\
-        .encode().decode('utf-8')
+        for spec in specs:
+            if spec.data_qa:
+                self.by_data_qa.setdefault((spec.tag, spec.data_qa), []).append(spec)
+            else:
+                self.by_class.setdefault((spec.tag, spec.css_class), []).append(spec)
+
+    def match(self, node):
+        attributes = node.attributes
+        key = (node.tag, attributes.get("data-qa"))
+
+        if key in self.by_data_qa:
+            return key
         
-        return salary
-    
-    else:
-        logging.warning("No salary found")
+        classes = attributes.get("class")
+
+        if classes:
+            for css_class in classes.split():
+                if (node.tag, css_class) in self.by_class:
+                    return (node.tag, css_class)
+
         return None
 
+    def collect(self, root, found):
+        for node in root.iter():
+            key = self.match(node)
 
-def detect_salary_type(salary: str):
-    if salary is None:
-        return "no numbers"
-    
-    elif salary.lower() == "по договорённости":
-        return "no numbers"
-    
-    elif "–" in salary:
-        return "fork"
-    
-    elif not salary:
-        return "no numbers"
+            if key is None:
+                self.collect(node, found)
+            
+            elif key not in found:
+                found[key] = node
 
-    elif "от" in salary.lower():
-        return "min"
-    
-    elif "до" in salary.lower():
-        return "max"
+        return found
 
-    else:
-        return "fixed"
+    def extract(self, root):
+        found = self.collect(root, {})
+        values = dict.fromkeys(spec.name for spec in self.specs)
+        text_fields = []
+
+        for key, node in found.items():
+            for spec in self.by_data_qa.get(key) or self.by_class[key]:
+                if spec.attribute:
+                    values[spec.name] = node.attributes.get(spec.attribute)
+                else:
+                    values[spec.name] = node.text()
+                    text_fields.append(spec.name)
+
+        if text_fields:
+            # normalise all text fields with one call
+            normalized = unicodedata.normalize("NFKD", "\x00".join(values[name] for name in text_fields))
+            values.update(zip(text_fields, normalized.split("\x00")))
+
+        return values
+
+
+serp_item_extractor = FieldExtractor(SERP_ITEM_FIELDS)
+
+
+def detect_salary_type(salary: str):
+    return parse_salary(salary).type
 
 
 def parse_url(selector: Selector):
@@ -91,136 +136,72 @@ def parse_url(selector: Selector):
         return None
 
 
-def parse_id(selector: Selector):
-    """ Get the id of a vacancy from a selector"""
-    id_selector = selector.css_first("a[data-qa='vacancy-serp__vacancy_response']")
-    
-    if id_selector:
-        url = id_selector.attributes["href"]
-        id = parse_qs(urlparse(url).query).get("vacancyId")[0]
-        
-        return id
-        
-    
-    else:
+def id_from_response_url(url: str):
+    """ Get the id of a vacancy from the url of response button"""
+    if url is None:
         logging.warning("No id found")
         return None
-
-
-def parse_city(selector: Selector):
-    city_selector = selector.css_first("div[data-qa='vacancy-serp__vacancy-address']")
-    
-    if city_selector:
-        raw_city = city_selector.text()
-        city = unicodedata.normalize('NFKD', raw_city)\
-        .encode().decode('utf-8')
-        
-        return city
-    
-    else:
-        logging.warning("No city found")
-        return None
-
-
-def parse_experience(selector: Selector) -> list:
-    """ Get the experience of a vacancy from a selector"""
-    experience_selector = selector.css_first("div[data-qa='vacancy-serp__vacancy-work-experience']")
     
-    if experience_selector:
-        experience_string = experience_selector.text()
-        
-        if "без опыта" in experience_string.lower():
-            return [0]
-        
-        experience_list = [int(match) for match in re.findall(r'\d+', experience_string)]
+    return parse_qs(urlparse(url).query).get("vacancyId")[0]
 
-        if len(experience_list) == 1:
-            return experience_list
-        
-        elif len(experience_list) == 2:
-            return experience_list
-        
-        else:
-            logging.warning("Invalid experience string")
-            return None
 
-    else:
+def experience_from_text(experience_string: str) -> tuple:
+    """ Get (experience_min, experience_max) of a vacancy from text of experience field"""
+    if experience_string is None:
         logging.warning("No experience found")
-        return None
-
+        return None, None
 
-def is_fresh(selector: Selector):
-    fresh_selector = selector.css_first("span[data-qa='vacancy-label-be-first']")
-    
-    if fresh_selector:
-        raw_fresh = fresh_selector.text()
-        fresh = unicodedata.normalize('NFKD', raw_fresh)\
-        .encode().decode('utf-8')
-        
-        if "откликнитесь среди первых" in fresh.lower():
-            return True
-        
-        else:
-            return False
+    if "без опыта" in experience_string.lower():
+        return 0, 0
     
-    else:
-        return False
+    experience_list = [int(match) for match in re.findall(r'\d+', experience_string)]
 
-
-def parse_company_name(selector: Selector):
-    company_name_selector = selector.css_first("a[data-qa='vacancy-serp__vacancy-employer']")
-    
-    if company_name_selector:
-        raw_company_name = company_name_selector.text()
-        company_name = unicodedata.normalize('NFKD', raw_company_name)\
-        .encode().decode('utf-8')
-        
-        return company_name
+    if len(experience_list) in (1, 2):
+        return experience_range(experience_list)
     
     else:
-        logging.warning("No company name found")
-        return None
+        logging.warning("Invalid experience string")
+        return None, None
 
 
-def parse_company_page_url(selector: Selector):
-    company_page_selector = selector.css_first("a[data-qa='vacancy-serp__vacancy-employer']")
-    
-    if company_page_selector:
-        url = company_page_selector.attributes["href"]
-        company_page = urljoin(VACANCY_BASE_URL, url)
-        
-        return company_page
-    
-    else:
-        logging.warning("No company page url found")
-        return None
+def is_fresh(fresh: str):
+    """ True if card has "Откликнитесь среди первых" label """
+    return fresh is not None and "откликнитесь среди первых" in fresh.lower()
 
 
 def parse_serp_item(selector: Selector, search_string) -> VacancyRAW:
-    salary = parse_salary(selector)
-    salary_type = detect_salary_type(salary)
-    salary_currency = detect_currency(salary) if salary else "RUB"
-    salary_min, salary_max = split_salary(salary_type, salary, salary_currency)
-    salary_min, salary_max = convert_currency(salary_currency, salary_min, salary_max, rates)
-    id = parse_id(selector)
+    fields = serp_item_extractor.extract(selector)
+    salary = fields["salary"]
+    parsed_salary = parse_salary(salary)
+    salary_min, salary_max = convert_currency(parsed_salary.currency, parsed_salary.min, parsed_salary.max)
+    id = id_from_response_url(fields["response_url"])
 
     if not id:
         return None
     
+    for name in ("title", "salary", "city", "company_name"):
+        if fields[name] is None:
+            logging.warning(f"No {name.replace('_', ' ')} found")
+
+    company_page = fields["company_page"]
+    experience_min, experience_max = experience_from_text(fields["experience"])
+    
     parsed_item = VacancyRAW(
-        title=parse_title(selector),
-        salary_type=salary_type,
+        title=fields["title"],
+        salary_type=parsed_salary.type,
         salary=salary,
         url= VACANCY_BASE_URL + id,
-        city=parse_city(selector),
-        experience=parse_experience(selector),
-        fresh=is_fresh(selector),
+        city=fields["city"],
+        experience_min=experience_min,
+        experience_max=experience_max,
+        fresh=is_fresh(fields["fresh"]),
         is_actual=True,
-        company_name=parse_company_name(selector),
-        company_page=parse_company_page_url(selector),
+        company_name=fields["company_name"],
+        company_page=urljoin(VACANCY_BASE_URL, company_page) if company_page else None,
         source_id=id,
         search_strings=[search_string.lower()],
-        when_scraped=datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+        # mongo keeps milliseconds, seconds are enough like before
+        when_scraped=datetime.now().replace(microsecond=0),
         company_address=None,
         description=None,
         employment_type=None,
@@ -230,7 +211,8 @@ def parse_serp_item(selector: Selector, search_string) -> VacancyRAW:
         responded=False,
         salary_min=salary_min,
         salary_max=salary_max,
-        salary_currency=salary_currency
+        salary_currency=parsed_salary.currency,
+        salary_tax=parsed_salary.tax
     
     )
     
@@ -268,5 +250,125 @@ def parse_pagination(html: str):
         logging.warning("No pagination found")
         return 1
 
+
+# ===================================== VACANCY PAGE =====================================
+
+def parse_description(html: Selector) -> str:
+    """Parse vacancy description from html"""
+    description_selector = html.css_first("div[data-qa='vacancy-description']")
+
+    if description_selector:
+        description = description_selector.text()
+        return description
+    
+    else:
+        logging.info("No description found")
+        return None
+
+
+def parse_key_skills(html: Selector) -> list:
+    skills_selector = html.css("span[data-qa='bloko-tag__text']")
+    key_skills = list()
+
+    if skills_selector:
+        for skill in skills_selector:
+            key_skills.append(skill.text())
+
+    return key_skills
+
+
+def parse_company_address(html: Selector) -> str:
+    address_selector_one = html.css_first("span[data-qa='vacancy-view-raw-address']")
+    address_selector_two = html.css_first("p[data-qa='vacancy-view-location']")
+
+    if address_selector_one:
+        address = address_selector_one.text()
+        return address
+    
+    if address_selector_two:
+        address = address_selector_two.text()
+        return address
+    
+    else:
+        logging.info("No address found")
+        return None
+
+
+def parse_company_rating(html: Selector) -> float:
+    rating_selector = html.css_first("span[data-qa='employer-rating']")
+
+    if rating_selector:
+        rating = rating_selector.text()
+        return float(rating)
+    
+    else:
+        logging.info("No rating found")
+        return None
+
+
+def parse_company_reviews(html: Selector) -> int:
+    reviews_selector = html.css_first("a[data-qa='vacancy-company-reviews-count']")
+
+    if reviews_selector:
+        reviews = reviews_selector.text()
+        return int(reviews)
+    
+    else:
+        logging.info("No reviews found")
+        return None
+    
+
+def parse_company_recommendations(html: Selector) -> int:
+    recommendations_selector = html.css_first("a[data-qa='vacancy-company-reviews-recommendations']")
+
+    if recommendations_selector:
+        recommendations = recommendations_selector.text()
+        return int(recommendations)
+    
+    else:
+        logging.info("No recommendations found")
+        return None
+
+
+def parse_employment_type(html: Selector) -> str:
+    employment_type_selector = html.css_first("p[data-qa='vacancy-view-employment-mode']")
+
+    if employment_type_selector:
+        employment_type = employment_type_selector.text()
+        return employment_type
+    
+    else:
+        logging.info("No employment type found")
+        return None
+
+def parse_vacancy_details(html) -> dict:
+    selectolax = HTMLParser(html)
+    description = parse_description(selectolax)
+
+    return {
+        "description": description,
+        "key_skills": parse_key_skills(selectolax),
+        "extracted_skills": extract_skills(description),
+        "company_address": parse_company_address(selectolax),
+        "employment_type": parse_employment_type(selectolax),
+    }
+
+
+def detect_is_archived(html):
+    """ function to detect if the vacancy is archived """
+    selectolax = HTMLParser(html)
+    archived_selector = selectolax.css_first("div.vacancy-section > h2")
+
+    if archived_selector:
+        
+        if "архив" in archived_selector.text().lower():
+            return True
+        else:
+            return False
+
+    else:
+        return False
+
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
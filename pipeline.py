@@ -0,0 +1,139 @@
+"""
+Small queue based pipeline.
+Every stage has its own bounded queue and a fixed amount of workers,
+so a slow stage holds back the previous one instead of piling up items in memory.
+"""
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    processed: int = 0
+    failed: int = 0
+    emitted: int = 0
+    busy_seconds: float = 0
+    started: float = field(default_factory=time.perf_counter)
+    finished: float = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def throughput(self):
+        return self.processed / self.elapsed if self.elapsed else 0
+
+    def report(self):
+        return (f"{self.name}: {self.processed} items ({self.failed} failed, "
+                f"{self.emitted} emitted) in {self.elapsed:.1f}s, "
+                f"{self.throughput:.2f} items/s, workers {self.workers}, "
+                f"busy {self.busy_seconds:.1f}s")
+
+
+class Stage:
+    """
+    `handler` is a coroutine function which takes one item
+    and returns iterable of items for the next stage or None.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=100):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = StageStats(name, workers)
+        self.next_stage = None
+        self.tasks = []
+
+    def start(self):
+        self.stats.started = time.perf_counter()
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    async def work(self):
+        while True:
+            item = await self.queue.get()
+            start = time.perf_counter()
+
+            try:
+                results = await self.handler(item)
+
+                if results and self.next_stage:
+                    for result in results:
+                        await self.next_stage.queue.put(result)
+                        self.stats.emitted += 1
+
+                self.stats.processed += 1
+
+            except Exception as exc:
+                self.stats.failed += 1
+                logging.exception("Stage %s failed on item: %s", self.name, exc)
+
+            finally:
+                self.stats.busy_seconds += time.perf_counter() - start
+                self.queue.task_done()
+
+    async def stop(self):
+        await self.queue.join()
+
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.stats.finished = time.perf_counter()
+
+
+class Pipeline:
+
+    def __init__(self, stages, progress_interval=None, total=None):
+        self.stages = stages
+        self.progress_interval = progress_interval
+        self.total = total
+
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    async def run(self, source):
+        for stage in self.stages:
+            stage.start()
+
+        reporter = asyncio.create_task(self.report_progress()) if self.progress_interval else None
+
+        try:
+            if hasattr(source, "__aiter__"):
+                async for item in source:
+                    await self.stages[0].queue.put(item)
+            else:
+                for item in source:
+                    await self.stages[0].queue.put(item)
+
+            # stages are drained in order, so every stage gets all the items from previous one
+            for stage in self.stages:
+                await stage.stop()
+
+        finally:
+            for stage in self.stages:
+                for task in stage.tasks:
+                    task.cancel()
+
+            if reporter:
+                reporter.cancel()
+
+        self.log_stats()
+        return [stage.stats for stage in self.stages]
+
+    async def report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            stats = self.stages[-1].stats
+            done = stats.processed + stats.failed
+            left = f", {max(self.total - done, 0)} left" if self.total is not None else ""
+            logging.info(f"Progress: {done} done{left}, {stats.throughput:.2f} items/s")
+
+    def log_stats(self):
+        for stage in self.stages:
+            logging.info(stage.stats.report())
@@ -0,0 +1,129 @@
+"""
+Labels every received page by status, headers and cheap body markers,
+so a DDoS-Guard or captcha page is not parsed as an empty SERP.
+Pages with real content are never labeled as blocked: DDoS-Guard server header
+and its scripts are present on every page of the protected site, not only on challenge pages.
+
+Labels: ok, blocked, captcha, not-found, archived, truncated.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from selectolax.parser import HTMLParser
+
+from retry import BLOCK, CAPTCHA as CAPTCHA_ERROR, INCOMPLETE, NOT_FOUND as NOT_FOUND_ERROR
+
+OK = "ok"
+BLOCKED = "blocked"
+CAPTCHA = "captcha"
+NOT_FOUND = "not-found"
+ARCHIVED = "archived"
+TRUNCATED = "truncated"
+
+# labels of pages which can be used by parsers
+USABLE = {OK, ARCHIVED}
+# error classes of retry module for labels of unusable pages
+ERROR_KINDS = {
+    BLOCKED: BLOCK,
+    CAPTCHA: CAPTCHA_ERROR,
+    TRUNCATED: INCOMPLETE,
+    NOT_FOUND: NOT_FOUND_ERROR,
+}
+
+# markers of the challenge page itself
+BLOCK_MARKERS = ("<title>DDoS-Guard</title>", "Checking your browser before accessing", "ddos-guard/js-challenge")
+CAPTCHA_MARKERS = ("/account/captcha", "captcha-input", "Подтвердите, что вы не робот")
+SERP_MARKER = "serp-item"
+# valid SERP of a search without results
+EMPTY_SERP_MARKERS = ("ничего не найдено",)
+VACANCY_MARKER = 'data-qa="vacancy-description"'
+# <div class="vacancy-section"><h2 ...>Вакансия в архиве</h2>, heading can have nested tags
+SECTION_HEADING = re.compile(r'<div[^>]*class="[^"]*\bvacancy-section\b[^"]*"[^>]*>\s*<h2[^>]*>.*?</h2>', re.S)
+
+
+@dataclass
+class FetchedPage:
+    html: str
+    status: int = 200
+    headers: dict = field(default_factory=dict)
+
+
+def classify_response(status, headers, body, page_kind=None):
+    """
+    page_kind - "serp", "vacancy" or None for pages without content checks.
+    headers are accepted for transports which know them, blocks are detected by status and body only.
+    """
+
+    if status in (404, 410):
+        return NOT_FOUND
+
+    has_content = has_expected_content(body, page_kind)
+
+    if not has_content:
+        if any(marker in body for marker in CAPTCHA_MARKERS):
+            return CAPTCHA
+
+        if status in (403, 429) or any(marker in body for marker in BLOCK_MARKERS):
+            return BLOCKED
+
+    # browser returns inner html of <html> tag, so closing </html> can't be checked
+    if body and "</body>" not in body:
+        return TRUNCATED
+
+    if page_kind in ("serp", "vacancy") and not has_content:
+        return TRUNCATED
+
+    if page_kind == "vacancy" and is_archive_notice(body):
+        return ARCHIVED
+
+    return OK
+
+
+def has_expected_content(body, page_kind):
+    if page_kind == "serp":
+        return SERP_MARKER in body or any(marker in body for marker in EMPTY_SERP_MARKERS)
+
+    if page_kind == "vacancy":
+        return VACANCY_MARKER in body or is_archive_notice(body)
+
+    return False
+
+
+def is_archive_notice(html):
+    """ text of the section heading is checked like afterscraper.detect_is_archived does, html can be a fragment """
+    if "архив" not in html:
+        return False
+
+    return any("архив" in HTMLParser(match.group()).text().lower() for match in SECTION_HEADING.finditer(html))
+
+
+class ClassificationStats:
+    """ counts of labels overall, per transport and per proxy """
+
+    def __init__(self):
+        self.labels = Counter()
+        self.by_transport = Counter()
+        self.by_proxy = Counter()
+
+    def record(self, label, transport, proxy):
+        self.labels[label] += 1
+        self.by_transport[(transport, label)] += 1
+        self.by_proxy[(proxy, label)] += 1
+
+    def as_dict(self):
+        by_proxy = {}
+        for (proxy, label), count in self.by_proxy.items():
+            by_proxy.setdefault(proxy, {})[label] = count
+
+        by_transport = {}
+        for (transport, label), count in self.by_transport.items():
+            by_transport.setdefault(transport, {})[label] = count
+
+        return {"labels": dict(self.labels), "by_transport": by_transport, "by_proxy": by_proxy}
+
+    def report(self):
+        return "Responses: " + ", ".join(f"{label} {count}" for label, count in self.labels.most_common())
+
+
+classification_stats = ClassificationStats()
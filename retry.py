@@ -0,0 +1,146 @@
+"""
+Retry, backoff and circuit breaker helpers for html_scraper.get_html.
+"""
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+import httpx
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeout
+
+# error classes
+TIMEOUT = "timeout"
+PROXY = "proxy"
+CONNECTION = "connection"
+BROWSER = "browser"
+BLOCK = "block"
+CAPTCHA = "captcha"
+NOT_FOUND = "not found"
+EMPTY = "empty"
+INCOMPLETE = "incomplete"
+OTHER = "other"
+
+# errors which are caused by the proxy rather than by the transport itself
+PROXY_ERRORS = {TIMEOUT, PROXY, CONNECTION, BLOCK, CAPTCHA}
+# faults of the transport itself, only they are counted by the transport circuit breaker,
+# proxy and content errors are handled by cooldowns of the proxy scheduler
+TRANSPORT_ERRORS = {BROWSER, OTHER}
+
+# transports which get_html tries one after another for "auto" parameter
+ESCALATION = ("httpx", "browser")
+# pages which transport got but can't be used, next transport is tried without retries
+ESCALATE_AT_ONCE = {BLOCK, CAPTCHA, INCOMPLETE}
+# there is nothing to retry, page doesn't exist
+NOT_RETRIED = {NOT_FOUND}
+
+
+class FetchError(Exception):
+    """ raised by transports when the page is not received """
+
+    def __init__(self, kind, message=""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+# exceptions which are retried, anything else is a bug and is raised
+FETCH_EXCEPTIONS = (FetchError, httpx.HTTPError, PlaywrightError, asyncio.TimeoutError)
+
+
+def classify_error(exc):
+    """ map exception from any transport to one of the error classes """
+    if isinstance(exc, FetchError):
+        return exc.kind
+
+    if isinstance(exc, (httpx.TimeoutException, PlaywrightTimeout)):
+        return TIMEOUT
+
+    if isinstance(exc, httpx.ProxyError):
+        return PROXY
+
+    if isinstance(exc, (httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError)):
+        return CONNECTION
+
+    if isinstance(exc, PlaywrightError):
+        if "ERR_PROXY" in str(exc) or "ERR_TUNNEL" in str(exc):
+            return PROXY
+        return BROWSER
+
+    return OTHER
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    # proxy errors are retried almost at once with another proxy,
+    # block pages need the longest pause
+    delay_factors: dict = field(default_factory=lambda: {
+        PROXY: 0.25,
+        CONNECTION: 0.5,
+        TIMEOUT: 1.0,
+        BROWSER: 1.0,
+        EMPTY: 1.0,
+        INCOMPLETE: 1.0,
+        OTHER: 1.0,
+        BLOCK: 3.0,
+        CAPTCHA: 3.0,
+    })
+
+    def delay(self, attempt, kind):
+        """ exponential backoff with full jitter """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, ceiling * self.delay_factors.get(kind, 1.0))
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures per key (transport or proxy).
+    After `threshold` failures key is open for `reset_timeout` seconds,
+    then one trial request is allowed (half-open state).
+    """
+
+    def __init__(self, threshold=5, reset_timeout=60.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened_at = {}
+
+    def allow(self, key):
+        opened_at = self.opened_at.get(key)
+
+        if opened_at is None:
+            return True
+
+        if time.monotonic() - opened_at >= self.reset_timeout:
+            # half-open, let one request through and close it again if it fails
+            self.opened_at[key] = time.monotonic()
+            return True
+
+        return False
+
+    def record_success(self, key):
+        self.failures.pop(key, None)
+        self.opened_at.pop(key, None)
+
+    def record_failure(self, key):
+        self.failures[key] = self.failures.get(key, 0) + 1
+
+        if self.failures[key] >= self.threshold:
+            if key not in self.opened_at:
+                logging.warning("Circuit opened for %s", key)
+            self.opened_at[key] = time.monotonic()
+
+    def retry_after(self, key):
+        """ seconds until the open key becomes half-open """
+        opened_at = self.opened_at.get(key)
+
+        if opened_at is None:
+            return 0.0
+
+        return max(0.0, self.reset_timeout - (time.monotonic() - opened_at))
+
+    def is_open(self, key):
+        return key in self.opened_at
@@ -0,0 +1,167 @@
+"""
+Salary string normalisation.
+
+One compiled regex parses the whole salary string of hh card:
+    "от 150 000 ₽ на руки", "150 000 – 250 000 ₽ до вычета налогов", "до 3 000 $", "по договорённости"
+and gives (type, min, max, currency, tax) in one pass.
+parse_salary works with one string, normalize_salaries applies the same regex
+to a whole pandas Series at once, so exported or stored salaries can be re-normalised in bulk.
+"""
+import re
+import logging
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from currency_rates import rates_provider
+
+# 5 типов зп:
+# 1. По договоренности - "no numbers"
+# 2. Вилка "fork"
+# 3. Одно число "fixed"
+# 4. от "min"
+# 5. до "max"
+NO_NUMBERS = "no numbers"
+FORK = "fork"
+FIXED = "fixed"
+MIN = "min"
+MAX = "max"
+
+NET = "net"
+GROSS = "gross"
+
+CURRENCIES = {
+    "RUB": "₽",
+    "USD": "$",
+    "EUR": "€",
+    "KZT": "₸",
+    "AZN": "₼"
+}
+CURRENCY_CODES = {symbol: code for code, symbol in CURRENCIES.items()}
+CURRENCY_CODES.update({"руб.": "RUB", "руб": "RUB"})
+DEFAULT_CURRENCY = "RUB"
+TAXES = {"на руки": NET, "до вычета налогов": GROSS}
+
+# hh separates thousands with narrow no-break space and currency with no-break space
+SPACES = dict.fromkeys(map(ord, "\xa0\u202f\u2007\u2009"), " ")
+
+NUMBER = r"\d(?:[\d ]*\d)?"
+TAX = r"на руки|до вычета налогов"
+SALARY_PATTERN = re.compile(
+    rf"(?P<tax_before>{TAX})?\s*"
+    rf"(?:(?P<bound>от|до)\s*)?"
+    rf"(?P<first>{NUMBER})"
+    rf"(?:\s*(?:[–—-]|до)\s*(?P<second>{NUMBER}))?"
+    rf"\s*(?P<currency>[₽$€₸₼]|руб\.?)?"
+    rf"\s*(?P<tax_after>{TAX})?",
+    re.IGNORECASE,
+)
+
+
+class Salary(NamedTuple):
+    type: str
+    min: Optional[int]
+    max: Optional[int]
+    currency: str
+    tax: Optional[str]
+
+
+def to_int(number):
+    return int(number.replace(" ", "")) if number else None
+
+
+def parse_salary(salary: str) -> Salary:
+    """ parse salary string of hh card, amounts are in the salary currency """
+    if not salary:
+        return Salary(NO_NUMBERS, None, None, DEFAULT_CURRENCY, None)
+
+    match = SALARY_PATTERN.search(salary.translate(SPACES))
+
+    if match is None:
+        if "договор" not in salary.lower():
+            logging.warning(f"Unknown salary format: {salary}")
+        return Salary(NO_NUMBERS, None, None, DEFAULT_CURRENCY, None)
+
+    first, second = to_int(match["first"]), to_int(match["second"])
+    bound = match["bound"].lower() if match["bound"] else None
+    tax = match["tax_before"] or match["tax_after"]
+    currency = CURRENCY_CODES.get(match["currency"].lower() if match["currency"] else None, DEFAULT_CURRENCY)
+    tax = TAXES[tax.lower()] if tax else None
+
+    if second is not None:
+        return Salary(FORK, first, second, currency, tax)
+
+    if bound == "от":
+        return Salary(MIN, first, None, currency, tax)
+
+    if bound == "до":
+        return Salary(MAX, None, first, currency, tax)
+
+    return Salary(FIXED, first, first, currency, tax)
+
+
+def convert_currency(currency, salary_min, salary_max, rates=None):
+    """ min and max converted to rubles, (None, None) if there is no rate for the currency """
+    if rates is None:
+        rates = rates_provider.get_rates()
+
+    rate = rates.get(currency)
+
+    if rate is None:
+        logging.warning(f"No rate for currency {currency}")
+        return None, None
+
+    converted_min = round(salary_min / rate) if salary_min is not None else None
+    converted_max = round(salary_max / rate) if salary_max is not None else None
+
+    return converted_min, converted_max
+
+
+def normalize_salaries(salaries: pd.Series, rates=None, convert=True) -> pd.DataFrame:
+    """
+    Batch version of parse_salary for a whole column of salary strings.
+    Returns frame with the same index and columns
+    salary_type, salary_min, salary_max, salary_currency, salary_tax.
+    With convert=True min and max are converted to rubles like in parsed items,
+    amounts are nullable Int64.
+    Salary strings repeat a lot, so every distinct string is parsed only once.
+    """
+    codes, uniques = pd.factorize(salaries.fillna(""))
+    parts = pd.Series(uniques, dtype="string").str.translate(SPACES).str.extract(SALARY_PATTERN)
+
+    first = pd.to_numeric(parts["first"].str.replace(" ", "", regex=False), errors="coerce")
+    second = pd.to_numeric(parts["second"].str.replace(" ", "", regex=False), errors="coerce")
+    bound = parts["bound"].str.lower()
+    has_first, has_second = first.notna().to_numpy(), second.notna().to_numpy()
+    is_from = (bound == "от").to_numpy(dtype=bool, na_value=False)
+    is_to = (bound == "до").to_numpy(dtype=bool, na_value=False)
+
+    salary_type = np.select(
+        [~has_first, has_second, is_from, is_to],
+        [NO_NUMBERS, FORK, MIN, MAX],
+        default=FIXED,
+    )
+    salary_min = first.where((salary_type != MAX) & has_first)
+    salary_max = second.where(has_second, first.where(np.isin(salary_type, (MAX, FIXED))))
+
+    currency = parts["currency"].str.lower().map(CURRENCY_CODES).fillna(DEFAULT_CURRENCY)
+    tax = parts["tax_before"].fillna(parts["tax_after"]).str.lower().map(TAXES)
+
+    if convert:
+        if rates is None:
+            rates = rates_provider.get_rates()
+
+        rate = currency.map(rates)
+        salary_min = (salary_min / rate).round()
+        salary_max = (salary_max / rate).round()
+
+    normalized = pd.DataFrame({
+        "salary_type": salary_type,
+        "salary_min": salary_min.astype("Int64"),
+        "salary_max": salary_max.astype("Int64"),
+        "salary_currency": currency.astype(object),
+        "salary_tax": tax.astype(object).where(tax.notna(), None),
+    })
+
+    return normalized.take(codes).set_index(salaries.index)
@@ -0,0 +1,273 @@
+"""
+Precomputed salary statistics.
+
+salary_facts keeps one small document per vacancy with salary:
+rubles value (fork midpoint, fixed value or the only bound), casefolded skills,
+city, experience bucket and salary_type.
+salary_stats keeps percentiles (p10/p25/median/p75/p90), counts and fork midpoints for groups
+    skill | skill + city | skill + experience | skill + city + experience
+each of them for every salary_type and for all types together, "all" stands for the whole dimension.
+
+refresh() takes vacancies changed since the previous refresh (updated_at watermark),
+updates their facts and recalculates statistics of the affected skills only.
+
+    python salary_stats.py refresh
+    python salary_stats.py rebuild
+    python salary_stats.py show python --city Москва
+    python salary_stats.py top --city Москва --experience 1-3
+"""
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne, DeleteOne, InsertOne, ASCENDING, DESCENDING
+from rich.logging import RichHandler
+
+from models import document_experience
+from skill_index import experience_bucket
+
+ALL = "all"
+PERCENTILES = {"p10": 10, "p25": 25, "median": 50, "p75": 75, "p90": 90}
+GROUPINGS = [("skill",), ("skill", "city"), ("skill", "experience"), ("skill", "city", "experience")]
+DIMENSIONS = ("skill", "city", "experience", "salary_type")
+VACANCY_PROJECTION = {"source_id": 1, "salary_type": 1, "salary_min": 1, "salary_max": 1, "city": 1,
+                      "experience_min": 1, "experience_max": 1, "experience": 1,
+                      "key_skills": 1, "extracted_skills": 1, "updated_at": 1}
+BATCH_SIZE = 1000
+SKILLS_CHUNK = 500
+
+
+def salary_value(salary_min, salary_max):
+    """ one number per vacancy, fork is represented by its midpoint """
+    if salary_min is not None and salary_max is not None:
+        return (salary_min + salary_max) / 2
+    return salary_min if salary_min is not None else salary_max
+
+
+def to_fact(document):
+    """ None if vacancy has no salary or no skills """
+    value = salary_value(document.get("salary_min"), document.get("salary_max"))
+    skills = {}
+
+    for skill in (document.get("key_skills") or []) + (document.get("extracted_skills") or []):
+        skill = skill.strip()
+        if skill:
+            skills.setdefault(skill.casefold(), skill)
+
+    if value is None or not skills:
+        return None
+
+    return {
+        "_id": document["source_id"],
+        "skills": list(skills),
+        "skill_names": list(skills.values()),
+        "city": document.get("city") or "unknown",
+        "experience": experience_bucket(*document_experience(document)),
+        "salary_type": document.get("salary_type") or "unknown",
+        "value": float(value),
+        "midpoint": float(value) if document.get("salary_type") == "fork" else None,
+    }
+
+
+def facts_frame(facts, skills):
+    """ one row per (fact, skill) for the requested skills """
+    rows = [{"skill": skill, "skill_name": name, "city": fact["city"], "experience": fact["experience"],
+             "salary_type": fact["salary_type"], "value": fact["value"], "midpoint": fact["midpoint"]}
+            for fact in facts
+            for skill, name in zip(fact["skills"], fact["skill_names"]) if skill in skills]
+
+    return pd.DataFrame(rows, columns=["skill", "skill_name", "city", "experience", "salary_type",
+                                       "value", "midpoint"]).astype({"value": float, "midpoint": float})
+
+
+def describe_groups(frame):
+    """ statistics rows for every grouping of the frame """
+    if frame.empty:
+        return []
+
+    names = frame.groupby("skill")["skill_name"].first()
+    rows = []
+
+    for grouping in GROUPINGS:
+        for split_types in (True, False):
+            keys = list(grouping) + (["salary_type"] if split_types else [])
+            grouped = frame.groupby(keys, sort=False, dropna=False)
+
+            # pandas quantile uses the same linear interpolation as np.percentile
+            percentiles = grouped["value"].quantile([q / 100 for q in PERCENTILES.values()]).unstack()
+            percentiles.columns = list(PERCENTILES)
+            stats = percentiles.join(grouped["value"].size().rename("count"))
+            stats = stats.join(grouped["midpoint"].count().rename("forks"))
+            stats = stats.join(grouped["midpoint"].median().rename("fork_midpoint"))
+
+            for key, values in stats.iterrows():
+                key = dict(zip(keys, key if isinstance(key, tuple) else (key,)))
+                row = {dimension: key.get(dimension, ALL) for dimension in DIMENSIONS}
+                row["skill_name"] = names[row["skill"]]
+                row.update({name: round(float(values[name])) for name in PERCENTILES})
+                row["count"] = int(values["count"])
+                row["forks"] = int(values["forks"])
+                row["fork_midpoint"] = None if np.isnan(values["fork_midpoint"]) else round(float(values["fork_midpoint"]))
+                rows.append(row)
+
+    return rows
+
+
+class SalaryStats:
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.vacancies = db_manager.collection
+        self.facts = db_manager.db.salary_facts
+        self.stats = db_manager.db.salary_stats
+        self.state = db_manager.db.salary_stats_state
+
+    async def ensure_indexes(self):
+        await self.facts.create_index("skills")
+        await self.stats.create_index([(dimension, ASCENDING) for dimension in DIMENSIONS], unique=True)
+        await self.stats.create_index([("city", ASCENDING), ("experience", ASCENDING),
+                                       ("salary_type", ASCENDING), ("median", DESCENDING)])
+
+    async def watermark(self):
+        state = await self.state.find_one({"_id": "watermark"})
+        return state["value"] if state else None
+
+    async def update_facts(self, documents):
+        """ returns skills which statistics have to be recalculated, old and new ones """
+        ids = [document["source_id"] for document in documents]
+        old_facts = {fact["_id"]: fact async for fact in self.facts.find({"_id": {"$in": ids}}, {"skills": 1})}
+        affected = {skill for fact in old_facts.values() for skill in fact["skills"]}
+        operations = []
+
+        for document in documents:
+            fact = to_fact(document)
+
+            if fact:
+                affected.update(fact["skills"])
+                operations.append(UpdateOne({"_id": fact["_id"]}, {"$set": fact}, upsert=True))
+            elif document["source_id"] in old_facts:
+                operations.append(DeleteOne({"_id": document["source_id"]}))
+
+        if operations:
+            await self.facts.bulk_write(operations, ordered=False)
+
+        return affected
+
+    async def recalculate(self, skills):
+        """ statistics of the skills are replaced, facts are loaded by chunks of skills """
+        skills = sorted(skills)
+        groups = 0
+
+        for start in range(0, len(skills), SKILLS_CHUNK):
+            chunk = set(skills[start:start + SKILLS_CHUNK])
+            facts = [fact async for fact in self.facts.find({"skills": {"$in": list(chunk)}})]
+            rows = describe_groups(facts_frame(facts, chunk))
+
+            await self.stats.delete_many({"skill": {"$in": list(chunk)}})
+            if rows:
+                await self.stats.bulk_write([InsertOne(row) for row in rows], ordered=False)
+            groups += len(rows)
+
+        return groups
+
+    async def refresh(self, full=False):
+        """ facts of changed vacancies are updated, then statistics of affected skills """
+        watermark = None if full else await self.watermark()
+        query = self.db_manager.changed_since(watermark)
+        affected, batch, processed = set(), [], 0
+        new_watermark = watermark
+
+        if full:
+            await self.facts.delete_many({})
+
+        async for document in self.vacancies.find(query, VACANCY_PROJECTION, batch_size=BATCH_SIZE):
+            if not document.get("source_id"):
+                continue
+
+            batch.append(document)
+
+            if document.get("updated_at") and (new_watermark is None or document["updated_at"] > new_watermark):
+                new_watermark = document["updated_at"]
+
+            if len(batch) >= BATCH_SIZE:
+                affected |= await self.update_facts(batch)
+                processed += len(batch)
+                batch = []
+
+        if batch:
+            affected |= await self.update_facts(batch)
+            processed += len(batch)
+
+        if full:
+            await self.stats.delete_many({})
+
+        groups = await self.recalculate(affected)
+        await self.state.update_one({"_id": "watermark"},
+                                    {"$set": {"value": new_watermark, "refreshed_at": datetime.utcnow()}},
+                                    upsert=True)
+        logging.info(f"Salary stats: {processed} vacancies changed, {len(affected)} skills, {groups} groups refreshed")
+        return groups
+
+    async def distribution(self, skill, city=ALL, experience=ALL, salary_type=ALL):
+        """ precomputed row or None """
+        return await self.stats.find_one({"skill": skill.casefold(), "city": city,
+                                          "experience": experience, "salary_type": salary_type},
+                                         {"_id": 0})
+
+    async def top_paid_skills(self, city=ALL, experience=ALL, salary_type=ALL, min_count=10, limit=10):
+        """ skills with the highest median salary, rare skills are skipped """
+        cursor = self.stats.find({"city": city, "experience": experience, "salary_type": salary_type,
+                                  "count": {"$gte": min_count}}, {"_id": 0}).sort("median", DESCENDING).limit(limit)
+        return [row async for row in cursor]
+
+
+def print_row(row):
+    print(f"{row['skill_name']:<30} {row['count']:>6} vacancies  "
+          + "  ".join(f"{name} {row[name]}" for name in PERCENTILES)
+          + f"  forks {row['forks']} (midpoint {row['fork_midpoint']})")
+
+
+async def main(argv=None):
+    from db_operations import MongoConnector
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["refresh", "rebuild", "show", "top"])
+    parser.add_argument("skill", nargs="?")
+    parser.add_argument("--city", default=ALL)
+    parser.add_argument("--experience", default=ALL, help='bucket like "0", "1-3", "3-6", "6+"')
+    parser.add_argument("--salary-type", default=ALL)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    db_manager = MongoConnector()
+    salary_stats = SalaryStats(db_manager)
+
+    try:
+        if args.command in ("refresh", "rebuild"):
+            await salary_stats.ensure_indexes()
+            await salary_stats.refresh(full=args.command == "rebuild")
+
+        elif args.command == "show":
+            row = await salary_stats.distribution(args.skill, args.city, args.experience, args.salary_type)
+            if row:
+                print_row(row)
+            else:
+                print("No salaries for this group")
+
+        else:
+            for row in await salary_stats.top_paid_skills(args.city, args.experience, args.salary_type,
+                                                          limit=args.limit):
+                print_row(row)
+
+    finally:
+        await db_manager.close_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    asyncio.run(main())
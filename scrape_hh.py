@@ -10,70 +10,128 @@ from rich.logging import RichHandler
 from rich import print
 import aiolimiter
 
-from html_scraper import get_html
-from parsers import parse_serp_page, parse_pagination, generate_pages
+from html_scraper import get_html, client_registry, escalation_report
+from html_cache import html_cache
+from parsers import generate_pages
+from parse_executor import parse_executor
 from search_words import search_words
-from validator import scrape_additional_data
-from db_operations import MongoConnector
+from validator import scrape_additional_data, filter_new_items
+from db_operations import MongoConnector, BulkVacancyWriter
 from afterscraper import update_rest_items
+from automated_browser import browser_pool
+from pipeline import Pipeline, Stage
+from tools import dump_proxy_stats
+from response_classifier import classification_stats
+from currency_rates import rates_provider
+from salary_stats import SalaryStats
 
 limiter = aiolimiter.AsyncLimiter(5, 1)
-browser_semaphore =  asyncio.Semaphore(10)
+PROXY_STATS_PATH = "proxy_stats.json"
+# load all stored source_ids at start, so SERP items are checked without db queries
+PRELOAD_KNOWN_IDS = True
+# recalculate salary statistics of skills which vacancies changed in this run
+REFRESH_SALARY_STATS = True
+# details of a vacancy found by several search words are fetched again before it is dropped,
+# other words were merged into it and skipped their own fetch
+SHARED_DETAILS_ATTEMPTS = 3
+# workers and queue size for every stage of the scraping pipeline,
+# "serp plan" workers is the amount of search words processed at once
+STAGES = {
+    "serp plan": {"workers": 3, "queue_size": len(search_words)},
+    "serp fetch": {"workers": 10, "queue_size": 50},
+    "parse": {"workers": parse_executor.workers, "queue_size": 20},
+    "details fetch": {"workers": 20, "queue_size": 200},
+    "db write": {"workers": 1, "queue_size": 200},
+}
 
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s - %(levelname)s - %(message)s",
                     handlers=[RichHandler()])
 
 
-async def run_hh_scraper(db_manager: MongoConnector):
+async def plan_search_word(word):
+    """ get a first page to detect pagination and generate urls of all pages """
+    url = f"https://hh.ru/search/vacancy?text={word}&salary=&ored_clusters=true&hhtmFrom=vacancy_search_list&hhtmFromLabel=vacancy_search_line"
+    
+    first_html = await get_html(url, "auto", limiter, page_kind="serp")
+
+    if not first_html:
+        logging.error("No html received")
+        return None
+
+    pages_amount = await parse_executor.pagination(first_html)
+    return [(word, page) for page in generate_pages(url, pages_amount, word)]
+
+
+async def fetch_serp_page(task):
+    word, page = task
+    html = await get_html(page, "auto", limiter, page_kind="serp")
+
+    if html:
+        return [(word, html)]
+
+
+def make_parse_handler(db_manager: MongoConnector, known_ids: set, writer: BulkVacancyWriter):
+
+    async def parse_page(task):
+        word, html = task
+        items = await parse_executor.serp_page(html, word)
+        return await filter_new_items(items, db_manager, known_ids, writer)
+    
+    return parse_page
+
 
-    for word in search_words:
-        url = f"https://hh.ru/search/vacancy?text={word}&salary=&ored_clusters=true&hhtmFrom=vacancy_search_list&hhtmFromLabel=vacancy_search_line"
-        
-        # First get a first page to detect pagination
-        first_html = await get_html(url, "httpx", limiter)
-        
-        if not first_html:
-            first_html = await get_html(url, "browser", browser_semaphore)
-
-        if not first_html:
-            logging.error("No html received")
-            continue
-
-        pages_amount = parse_pagination(first_html)
-        pages_urls = generate_pages(url, pages_amount, word)
-        tasks = []
-        
-        for page in pages_urls:
-            tasks.append(get_html(page, "browser", browser_semaphore))
-
-        pages_htmls = await asyncio.gather(*tasks)
-        parsed_items = []
-
-        if pages_htmls:
-            for html in pages_htmls:
-                if html:
-                    parsed_items.append(parse_serp_page(html, word))
-
-        if parsed_items:
-            for block in parsed_items:
-                tasks = []
-                
-                if block:
-                    for item in block:
-                        if item:
-                            tasks.append(scrape_additional_data(item, db_manager, limiter))
-                            
-                prepared_to_db = await asyncio.gather(*tasks)        
-                tasks = []
-
-                if prepared_to_db:
-                    for item in prepared_to_db:
-                        if item:
-                            tasks.append(db_manager.send_to_db(item))
-                    
-                    await asyncio.gather(*tasks)
+def make_details_handler(known_ids: set, writer: BulkVacancyWriter):
+
+    async def fetch_details(item):
+        for attempt in range(SHARED_DETAILS_ATTEMPTS):
+            details = await scrape_additional_data(item, limiter)
+
+            if details:
+                return [details]
+
+            # search strings can be merged while the page is fetched, so they are checked after every attempt
+            if len(item.search_strings) <= 1:
+                break
+
+            logging.warning("No details for %s found by %s search words, attempt %s", 
+                            item.source_id, len(item.search_strings), attempt + 1)
+
+        # another search word can find the vacancy and try again
+        writer.release(item)
+        if known_ids is not None:
+            known_ids.discard(item.source_id)
+
+    return fetch_details
+
+
+def make_write_handler(writer: BulkVacancyWriter):
+
+    async def write_item(item):
+        await writer.add(item)
     
+    return write_item
+
+
+async def run_hh_scraper(db_manager: MongoConnector):
+    writer = await BulkVacancyWriter(db_manager).start()
+    known_ids = await db_manager.load_known_ids() if PRELOAD_KNOWN_IDS else None
+
+    pipeline = Pipeline([
+        Stage("serp plan", plan_search_word, **STAGES["serp plan"]),
+        Stage("serp fetch", fetch_serp_page, **STAGES["serp fetch"]),
+        Stage("parse", make_parse_handler(db_manager, known_ids, writer), **STAGES["parse"]),
+        Stage("details fetch", make_details_handler(known_ids, writer), **STAGES["details fetch"]),
+        Stage("db write", make_write_handler(writer), **STAGES["db write"]),
+    ])
+
+    try:
+        await pipeline.run(search_words)
+
+    finally:
+        await writer.close()
+        logging.info(escalation_report("serp"))
+        logging.info(classification_stats.report())
     
 
 async def main():
@@ -81,10 +139,24 @@ async def main():
     db_manager = MongoConnector()
     db_manager.ping()
 
-    await db_manager.refresh_is_actual()
-    await run_hh_scraper(db_manager)
-    await update_rest_items(db_manager, limiter)
-    await db_manager.close_connection()
+    try:
+        await db_manager.ensure_indexes()
+        await rates_provider.load()
+        await db_manager.start_run()
+        await run_hh_scraper(db_manager)
+        await update_rest_items(db_manager, limiter)
+        await db_manager.finish_run()
+
+        if REFRESH_SALARY_STATS:
+            await SalaryStats(db_manager).refresh()
+
+    finally:
+        await browser_pool.close()
+        await client_registry.close()
+        html_cache.close()
+        parse_executor.shutdown()
+        await db_manager.close_connection()
+        dump_proxy_stats(PROXY_STATS_PATH)
     
     end_time = datetime.now()
     execution_time = end_time - start_time
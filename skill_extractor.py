@@ -0,0 +1,266 @@
+"""
+Extraction of skills from vacancy descriptions.
+
+Skills from skills.txt and descriptions are split into case-folded tokens
+(words and single punctuation marks, so "C#", "Node.js" and "A/B тестирование" keep their shape)
+and an Aho-Corasick automaton over token sequences finds all the skills
+in one linear pass over the description. Matches always start and end on token boundaries,
+"Java" is not found inside "JavaScript".
+The same skill is written in skills.txt in several ways ("REACT", "React", "react"),
+the spelling which hh tags (key_skills of output.csv) use most often is stored.
+Generic words like "Разработка" or "Поддержка" are not skills.
+
+Batch job fills extracted_skills for the stored vacancies:
+
+    python skill_extractor.py
+    python skill_extractor.py --processes --workers 4
+"""
+import re
+import ast
+import csv
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from collections import deque, Counter
+from functools import lru_cache
+
+from pymongo import UpdateOne
+from rich.logging import RichHandler
+
+SKILLS_PATH = Path(__file__).resolve().parent / "skills.txt"
+# export of the stored vacancies, key_skills in it are hh tags with their real spelling
+KEY_SKILLS_PATH = Path(__file__).resolve().parent / "output.csv"
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# some lines of skills.txt are lists like "Docker, Kubernetes, OpenShift"
+SKILL_SEPARATORS = re.compile(r"[,;]")
+# one letter skills like "С" or "R" are mostly prepositions and list markers in descriptions
+MIN_SKILL_LENGTH = 2
+# one word skills of skills.txt which are common words of any description, case-folded
+GENERIC_WORDS = frozenset({
+    "разработка", "поддержка", "консалтинг", "сопровождение", "обучение", "консультирование",
+    "программирование", "проектирование", "планирование", "производство", "продажи", "продукт",
+    "сервис", "поиск", "перевод", "ремонт", "монтаж", "сборка", "доставка", "закупки", "эксплуатация",
+    "оптимизация", "интеграция", "автоматизация", "аналитика", "диагностика", "мониторинг", "аудит",
+    "администрирование", "документирование", "моделирование", "прогнозирование", "отчетность",
+    "статьи", "модели", "логика", "динамика", "скорость", "офис", "дети", "мозг", "игры",
+    "аккуратность", "активность", "внимательность", "ответственность", "исполнительность",
+    "коммуникабельность", "стрессоустойчивость", "обучаемость", "грамотность", "гибкость",
+    "инициативность", "креативность", "лидерство", "мотивация", "дружелюбие", "дружелюбность",
+    "порядочность", "добросовестность", "усидчивость", "самоконтроль", "самодисциплина",
+    "эффективность", "продуктивность", "стабильность", "мобильность", "энтузиазм", "харизма",
+    "терпеливость", "системность", "многозадачность", "пунктуальность",
+})
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class SkillMatcher:
+    """ Aho-Corasick automaton, tokens are mapped to ints and states are kept in flat lists """
+
+    def __init__(self, skills, spelling_counts=None):
+        self.spelling_counts = spelling_counts or {}
+        self.vocabulary = {}
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.skills = []
+
+        for skill in skills:
+            self.add(skill)
+
+        self.build()
+
+    def add(self, skill):
+        tokens = tokenize(skill)
+
+        if sum(len(token) for token in tokens) < MIN_SKILL_LENGTH:
+            return
+
+        if len(tokens) == 1 and tokens[0] in GENERIC_WORDS:
+            return
+
+        state = 0
+        for token in tokens:
+            token_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+            next_state = self.transitions[state].get(token_id)
+
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.transitions[state][token_id] = next_state
+
+            state = next_state
+
+        # the same skill can be written in different case
+        if not self.outputs[state]:
+            self.outputs[state].append((len(self.skills), len(tokens)))
+            self.skills.append(skill)
+
+        elif self.spelling_order(skill) > self.spelling_order(self.skills[self.outputs[state][0][0]]):
+            self.skills[self.outputs[state][0][0]] = skill
+
+    def spelling_order(self, skill):
+        """ the most frequent spelling of hh tags wins, capitalized one if none of them is a tag """
+        return self.spelling_counts.get(skill, 0), skill[0].isupper()
+
+    def build(self):
+        """ fail links by BFS, outputs of fail states are merged into their children """
+        queue = deque(self.transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for token_id, child in self.transitions[state].items():
+                fallback = self.fail[state]
+
+                while fallback and token_id not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[child] = self.transitions[fallback].get(token_id, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+                queue.append(child)
+
+    def matches(self, tokens):
+        """ (start, end, skill_id) of every occurrence, end is exclusive """
+        state = 0
+
+        for position, token in enumerate(tokens):
+            token_id = self.vocabulary.get(token)
+
+            # token which is not a part of any skill breaks every match
+            if token_id is None:
+                state = 0
+                continue
+
+            while state and token_id not in self.transitions[state]:
+                state = self.fail[state]
+
+            state = self.transitions[state].get(token_id, 0)
+
+            for skill_id, length in self.outputs[state]:
+                yield position + 1 - length, position + 1, skill_id
+
+    def find(self, text: str) -> list:
+        """
+        skills in order of the first occurrence.
+        Leftmost longest matches win, "A/B тестирование" doesn't also give "Тестирование".
+        """
+        if not text:
+            return []
+
+        found = {}
+        covered_until = 0
+
+        for start, end, skill_id in sorted(self.matches(tokenize(text)), key=lambda match: (match[0], -match[1])):
+            if start >= covered_until:
+                found.setdefault(skill_id, None)
+                covered_until = end
+
+        return [self.skills[skill_id] for skill_id in found]
+
+
+def load_skills(path=SKILLS_PATH):
+    skills = []
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            for skill in SKILL_SEPARATORS.split(line):
+                skill = skill.strip().rstrip(".:!?").strip("()«»\"' ")
+
+                if skill:
+                    skills.append(skill)
+
+    return skills
+
+
+def load_spelling_counts(path=KEY_SKILLS_PATH) -> Counter:
+    """ how often every spelling is used by key_skills, empty if there is no export yet """
+    counts = Counter()
+
+    if not path.exists():
+        return counts
+
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            try:
+                counts.update(ast.literal_eval(row.get("key_skills") or "[]"))
+
+            except (ValueError, SyntaxError):
+                continue
+
+    return counts
+
+
+@lru_cache(maxsize=1)
+def get_matcher() -> SkillMatcher:
+    """ automaton is built once per process """
+    return SkillMatcher(load_skills(), load_spelling_counts())
+
+
+def extract_skills(description: str) -> list:
+    return get_matcher().find(description)
+
+# ===================================== BATCH JOB =====================================
+
+
+def extract_skills_record(description: str) -> list:
+    """ worker function for the process pool """
+    return extract_skills(description)
+
+
+def make_transform(executor):
+    async def transform(batch):
+        skills = await executor.map(extract_skills_record, [(document["description"],) for document in batch])
+        return [UpdateOne({"_id": document["_id"]},
+                          {"$set": {"extracted_skills": extracted},
+                           "$currentDate": {"updated_at": True}})
+                for document, extracted in zip(batch, skills)]
+
+    return transform
+
+
+def extraction_migration(executor, everything=False):
+    from migrations import Migration
+
+    query = {"description": {"$type": "string"}}
+
+    if not everything:
+        query["extracted_skills"] = {"$exists": False}
+
+    return Migration("extract_skills:all" if everything else "extract_skills", query=query, transform=make_transform(executor),
+                     projection={"description": 1}, repeatable=not everything)
+
+
+async def main(argv=None):
+    from migrations import MigrationRunner
+    from db_operations import MongoConnector
+    from parse_executor import ParseExecutor, PARSE_WORKERS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", action="store_true", help="extract skills in a process pool")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--all", action="store_true", help="extract again for vacancies which already have skills")
+    parser.add_argument("--restart", action="store_true", help="forget checkpoint of --all run")
+    args = parser.parse_args(argv)
+
+    executor = ParseExecutor("process" if args.processes else "inline", args.workers)
+    db_manager = MongoConnector()
+
+    try:
+        await MigrationRunner(db_manager).run(extraction_migration(executor, args.all), restart=args.restart)
+
+    finally:
+        executor.shutdown()
+        await db_manager.close_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    asyncio.run(main())
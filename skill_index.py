@@ -0,0 +1,204 @@
+"""
+Skill demand index.
+
+skill_demand collection keeps counters of vacancies per
+(skill, search string, city, experience bucket, scrape day).
+count grows when a vacancy is stored, archived grows when it goes to the archive,
+so count - archived is the number of open vacancies.
+Counters are updated by MongoConnector and BulkVacancyWriter as vacancies change,
+rebuild() recalculates them from the vacancies collection in one streaming pass.
+
+    python skill_index.py rebuild
+    python skill_index.py top python --city Москва --days 30
+"""
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne, ASCENDING
+from rich.logging import RichHandler
+
+from models import document_experience, parse_when_scraped
+
+KEY_FIELDS = ("search_string", "city", "experience", "day", "skill")
+# fields of the vacancy which are needed to build its keys, experience is the old layout of the range
+VACANCY_PROJECTION = {"key_skills": 1, "search_strings": 1, "city": 1, "experience_min": 1, "experience_max": 1,
+                      "experience": 1, "when_scraped": 1}
+BATCH_SIZE = 1000
+
+
+def experience_bucket(experience_min, experience_max):
+    """ (0, 0) - "0", (1, 3) - "1-3", (6, None) - "6+" """
+    if experience_min is None:
+        return "unknown"
+
+    if experience_max is None:
+        return f"{experience_min}+"
+
+    return "0" if experience_max == 0 else f"{experience_min}-{experience_max}"
+
+
+def scrape_day(when_scraped):
+    moment = parse_when_scraped(when_scraped)
+
+    if moment is None:
+        return None
+
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def demand_keys(document):
+    """ one key for every skill and search string of the vacancy """
+    skills = {skill.strip() for skill in document.get("key_skills") or [] if skill and skill.strip()}
+    search_strings = document.get("search_strings") or []
+
+    if isinstance(search_strings, str):
+        search_strings = [search_strings]
+
+    city = document.get("city")
+    experience = experience_bucket(*document_experience(document))
+    day = scrape_day(document.get("when_scraped"))
+
+    return [(search_string, city, experience, day, skill)
+            for search_string in set(search_strings) for skill in skills]
+
+
+def key_filter(key):
+    return dict(zip(KEY_FIELDS, key))
+
+
+class SkillIndex:
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([(field, ASCENDING) for field in KEY_FIELDS], unique=True)
+
+    async def increment(self, keys, field, amount=1):
+        if not keys:
+            return None
+
+        operations = [UpdateOne(key_filter(key), {"$inc": {field: amount * times}}, upsert=True)
+                      for key, times in Counter(keys).items()]
+        return await self.collection.bulk_write(operations, ordered=False)
+
+    async def add_vacancies(self, documents):
+        """ called after vacancies are inserted """
+        await self.increment([key for document in documents for key in demand_keys(document)], "count")
+
+    async def add_search_string(self, documents, search_string):
+        """ called when search string is added to stored vacancies, documents are their state before the update """
+        keys, archived = [], []
+
+        for document in documents:
+            document_keys = demand_keys({**document, "search_strings": [search_string]})
+            keys.extend(document_keys)
+
+            if document.get("is_archived"):
+                archived.extend(document_keys)
+
+        await self.increment(keys, "count")
+        await self.increment(archived, "archived")
+
+    async def archive_vacancy(self, document):
+        """ called when vacancy goes to the archive, document is its state before the update """
+        await self.increment(demand_keys(document), "archived")
+
+    async def rebuild(self, vacancies, batch_size=BATCH_SIZE):
+        """
+        Counters are summed in memory while vacancies are streamed,
+        memory depends on amount of distinct keys, not on amount of vacancies.
+        New counters are written to a temporary collection which replaces the index at once.
+        """
+        counts, archived = Counter(), Counter()
+        processed = 0
+
+        async for document in vacancies.find({}, {**VACANCY_PROJECTION, "is_archived": 1}, batch_size=batch_size):
+            keys = demand_keys(document)
+            counts.update(keys)
+
+            if document.get("is_archived"):
+                archived.update(keys)
+
+            processed += 1
+
+        database = self.collection.database
+        tmp_collection = database[f"{self.collection.name}_rebuild"]
+        await tmp_collection.drop()
+
+        documents = [{**key_filter(key), "count": count, "archived": archived.get(key, 0)}
+                     for key, count in counts.items()]
+
+        for start in range(0, len(documents), batch_size):
+            await tmp_collection.insert_many(documents[start:start + batch_size], ordered=False)
+
+        await tmp_collection.rename(self.collection.name, dropTarget=True)
+        self.collection = database[self.collection.name]
+        await self.ensure_indexes()
+        logging.info(f"Skill index rebuilt from {processed} vacancies, {len(documents)} counters")
+        return len(documents)
+
+    async def top_skills(self, search_string=None, city=None, experience=None,
+                         since=None, until=None, limit=10, open_only=False):
+        """ [(skill, vacancies)] sorted by demand """
+        match = {}
+
+        for field, value in (("search_string", search_string), ("city", city), ("experience", experience)):
+            if value is not None:
+                match[field] = value
+
+        if since or until:
+            match["day"] = {}
+            if since:
+                match["day"]["$gte"] = since
+            if until:
+                match["day"]["$lt"] = until
+
+        demand = {"$subtract": ["$count", {"$ifNull": ["$archived", 0]}]} if open_only else "$count"
+        cursor = self.collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$skill", "vacancies": {"$sum": demand}}},
+            {"$sort": {"vacancies": -1}},
+            {"$limit": limit},
+        ])
+        return [(item["_id"], item["vacancies"]) async for item in cursor]
+
+
+async def main(argv=None):
+    from db_operations import MongoConnector
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["rebuild", "top"])
+    parser.add_argument("search_string", nargs="?")
+    parser.add_argument("--city")
+    parser.add_argument("--experience", help='bucket like "0", "1-3", "3-6", "6+"')
+    parser.add_argument("--days", type=int, help="only vacancies scraped in the last days")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--open-only", action="store_true", help="don't count archived vacancies")
+    args = parser.parse_args(argv)
+
+    db_manager = MongoConnector()
+
+    try:
+        if args.command == "rebuild":
+            await db_manager.skill_index.rebuild(db_manager.collection)
+            return
+
+        since = scrape_day(datetime.now() - timedelta(days=args.days)) if args.days else None
+        top = await db_manager.skill_index.top_skills(args.search_string, args.city, args.experience,
+                                                      since=since, limit=args.limit, open_only=args.open_only)
+        for skill, vacancies in top:
+            print(f"{skill:<30} {vacancies}")
+
+    finally:
+        await db_manager.close_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""
+Cheap status check of a vacancy page for afterscraper.
+
+Response is streamed and reading stops as soon as the archive notice
+or the description block is seen, so most of the page is never downloaded or parsed.
+ETag / Last-Modified of the previous check are sent back as conditional request headers,
+304 means the vacancy didn't change since the last check.
+Browser is never used here, unknown status is simply left for the next run.
+Stored pages can be days old, so html_cache is read only in cache-only mode, which never goes to the network.
+Vacancy which is not found anymore (404, 410) is reported as archived.
+"""
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from html_scraper import client_registry, retry_policy
+from tools import proxy_scheduler, proxy_label
+from html_cache import html_cache
+from retry import FetchError, classify_error, PROXY, NOT_RETRIED, NOT_FOUND, FETCH_EXCEPTIONS
+from response_classifier import (classify_response, classification_stats, is_archive_notice,
+                                 VACANCY_MARKER, ERROR_KINDS, OK)
+
+ARCHIVED = "archived"
+ACTIVE = "active"
+NOT_MODIFIED = "not modified"
+UNKNOWN = "unknown"
+
+# description goes after the archive notice, if it is reached the vacancy is open
+ACTIVE_MARKER = re.compile(re.escape(VACANCY_MARKER.encode()))
+# markers can be split between two chunks
+TAIL_SIZE = 2048
+
+
+@dataclass
+class ProbeResult:
+    status: str
+    etag: str = None
+    last_modified: str = None
+    bytes_read: int = 0
+
+
+@dataclass
+class ProbeStats:
+    probes: int = 0
+    bytes_read: int = 0
+    archived: int = 0
+    active: int = 0
+    not_modified: int = 0
+    unknown: int = 0
+
+    def add(self, result: ProbeResult):
+        self.probes += 1
+        self.bytes_read += result.bytes_read
+        key = result.status.replace(" ", "_")
+        setattr(self, key, getattr(self, key) + 1)
+
+    def report(self):
+        average = self.bytes_read / self.probes / 1024 if self.probes else 0
+        return (f"Status probes: {self.probes}, archived {self.archived}, active {self.active}, "
+                f"not modified {self.not_modified}, unknown {self.unknown}, "
+                f"{average:.1f} KB read per probe")
+
+
+probe_stats = ProbeStats()
+
+
+def conditional_headers(etag=None, last_modified=None):
+    headers = {}
+
+    if etag:
+        headers["if-none-match"] = etag
+    if last_modified:
+        headers["if-modified-since"] = last_modified
+
+    return headers
+
+
+async def read_until_marker(response):
+    """ read body chunks until one of the markers is found """
+    tail = b""
+    bytes_read = 0
+
+    async for chunk in response.aiter_bytes():
+        bytes_read += len(chunk)
+        window = tail + chunk
+
+        # multibyte letters can be cut at the chunk border, they are dropped from the fragment
+        if is_archive_notice(window.decode("utf-8", errors="ignore")):
+            return ARCHIVED, bytes_read
+
+        if ACTIVE_MARKER.search(window):
+            return ACTIVE, bytes_read
+
+        tail = window[-TAIL_SIZE:]
+
+    return UNKNOWN, bytes_read
+
+
+async def probe_once(url, semaphore, proxy, etag=None, last_modified=None):
+    client = client_registry.get_client(proxy)
+
+    async with semaphore:
+        async with client.stream("GET", url, headers=conditional_headers(etag, last_modified)) as response:
+
+            if response.status_code == 304:
+                return ProbeResult(NOT_MODIFIED, etag, last_modified)
+
+            if response.status_code == 407:
+                raise FetchError(PROXY, "Proxy authentication required")
+
+            # body is not read yet, only status and headers are classified here
+            label = classify_response(response.status_code, response.headers, "")
+            classification_stats.record(label, "probe", proxy_label(proxy))
+
+            if label != OK:
+                raise FetchError(ERROR_KINDS[label], f"Page is {label}")
+
+            status, bytes_read = await read_until_marker(response)
+
+            return ProbeResult(status,
+                               response.headers.get("etag"),
+                               response.headers.get("last-modified"),
+                               bytes_read)
+
+
+def cached_status(html):
+    if is_archive_notice(html):
+        return ARCHIVED
+
+    return ACTIVE if VACANCY_MARKER in html else UNKNOWN
+
+
+async def probe_status(url, semaphore, etag=None, last_modified=None) -> ProbeResult:
+    result = ProbeResult(UNKNOWN)
+
+    if html_cache.cache_only:
+        html = await html_cache.get(url)
+        result = ProbeResult(cached_status(html) if html else UNKNOWN, etag, last_modified)
+        probe_stats.add(result)
+        return result
+
+    for attempt in range(retry_policy.attempts):
+        proxy = proxy_scheduler.acquire()
+        start = time.perf_counter()
+
+        try:
+            result = await probe_once(url, semaphore, proxy, etag, last_modified)
+            proxy_scheduler.report(proxy, "ok", time.perf_counter() - start)
+            break
+
+        except FETCH_EXCEPTIONS as exc:
+            kind = classify_error(exc)
+            proxy_scheduler.report(proxy, kind, time.perf_counter() - start)
+            logging.warning("Status probe error (%s) for %s, attempt %s", kind, url, attempt + 1)
+
+            if kind == NOT_FOUND:
+                # deleted vacancy is never shown again
+                result = ProbeResult(ARCHIVED)
+
+            if kind in NOT_RETRIED:
+                break
+
+            if attempt + 1 < retry_policy.attempts:
+                await asyncio.sleep(retry_policy.delay(attempt, kind))
+
+    probe_stats.add(result)
+    return result
@@ -1,18 +1,119 @@
-import os
-from itertools import cycle
+import json
+import time
+import random
+import logging
+from collections import deque
+from dataclasses import dataclass, field, asdict
 from random import shuffle
 
 from proxies import proxies
+from retry import PROXY_ERRORS
+from response_classifier import classification_stats
 
 
+def proxy_label(proxy):
+    """ host:port of httpx or playwright proxy without credentials """
+    if not proxy:
+        return "direct"
 
+    url = proxy.get("server") or proxy.get("all://") or next(iter(proxy.values()), "")
+    return url.replace("http://", "").split("@")[-1]
 
-proxy_gen = cycle(proxies)
+
+@dataclass
+class ProxyStats:
+    label: str
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    latency_ewma: float = None
+    bad_in_row: int = 0
+    cooldown_until: float = 0
+    recent: deque = field(default_factory=lambda: deque(maxlen=20))
+
+    @property
+    def success_rate(self):
+        # smoothed, so new proxies are not ranked below the bad ones
+        return (self.successes + 1) / (self.requests + 2)
+
+    def score(self):
+        latency = self.latency_ewma or 1.0
+        recent_bad = sum(1 for outcome in self.recent if outcome in PROXY_ERRORS)
+        return self.success_rate ** 2 / latency / (1 + recent_bad)
+
+    def to_dict(self):
+        stats = asdict(self)
+        stats["recent"] = list(self.recent)
+        stats["success_rate"] = round(self.success_rate, 3)
+        stats["cooldown_left"] = round(max(self.cooldown_until - time.monotonic(), 0), 1)
+        del stats["cooldown_until"]
+        return stats
+
+
+class ProxyScheduler:
+    """
+    Hands out proxies weighted by their health:
+    success rate, latency EWMA and recent proxy errors / blocks.
+    Proxy which failed is put on cooldown, cooldown grows with every failure in a row.
+    """
+
+    def __init__(self, proxies, cooldown=30.0, max_cooldown=600.0, ewma_alpha=0.3):
+        self.proxies = list(proxies)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.ewma_alpha = ewma_alpha
+        self.stats = {proxy_label(proxy): ProxyStats(proxy_label(proxy)) for proxy in self.proxies}
+
+    def acquire(self):
+        if not self.proxies:
+            return None
+
+        now = time.monotonic()
+        available = [proxy for proxy in self.proxies
+                     if self.stats[proxy_label(proxy)].cooldown_until <= now]
+
+        if not available:
+            # every proxy is cooling down, take the one which is released first
+            return min(self.proxies, key=lambda proxy: self.stats[proxy_label(proxy)].cooldown_until)
+
+        weights = [self.stats[proxy_label(proxy)].score() for proxy in available]
+        return random.choices(available, weights=weights)[0]
+
+    def report(self, proxy, outcome, latency=None):
+        """ outcome is "ok" or error class from retry module """
+        stats = self.stats.get(proxy_label(proxy))
+
+        if stats is None:
+            return
+
+        stats.requests += 1
+        stats.recent.append(outcome)
+
+        if latency is not None:
+            stats.latency_ewma = (latency if stats.latency_ewma is None
+                                  else self.ewma_alpha * latency + (1 - self.ewma_alpha) * stats.latency_ewma)
+
+        if outcome == "ok":
+            stats.successes += 1
+            stats.bad_in_row = 0
+            return
+
+        stats.failures += 1
+
+        if outcome in PROXY_ERRORS:
+            stats.bad_in_row += 1
+            cooldown = min(self.cooldown * 2 ** (stats.bad_in_row - 1), self.max_cooldown)
+            stats.cooldown_until = time.monotonic() + cooldown
+            logging.info("Proxy %s on cooldown for %.0fs after %s", stats.label, cooldown, outcome)
+
+    def dump_stats(self):
+        return sorted((stats.to_dict() for stats in self.stats.values()),
+                      key=lambda stats: stats["success_rate"], reverse=True)
 
 
 processed_proxies = []
 for proxy in proxies:
-    
+
     if not proxy.get('all://'):
         continue
     temp = proxy.get('all://').replace("http://", "").split("@")
@@ -28,5 +129,26 @@ for proxy in processed_proxies:
         "password" : proxy["password"]}
         )
 
-shuffle(playwright_proxies)     
-playwright_proxy_gen = cycle(playwright_proxies)
\ No newline at end of file
+shuffle(playwright_proxies)
+
+proxy_scheduler = ProxyScheduler(proxies)
+playwright_proxy_scheduler = ProxyScheduler(playwright_proxies)
+
+
+def dump_proxy_stats(path=None):
+    """ log stats of both schedulers and optionally save them to json with response labels per proxy """
+    stats = {"httpx": proxy_scheduler.dump_stats(),
+             "browser": playwright_proxy_scheduler.dump_stats()}
+
+    for transport, proxies_stats in stats.items():
+        for item in proxies_stats:
+            logging.info("%s proxy %s: %s requests, success rate %s, latency %s",
+                         transport, item["label"], item["requests"], item["success_rate"],
+                         round(item["latency_ewma"], 2) if item["latency_ewma"] else None)
+
+    if path:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({**stats, "responses": classification_stats.as_dict()}, 
+                      file, indent=2, ensure_ascii=False)
+
+    return stats
@@ -1,177 +1,38 @@
-import os
-import logging
 import asyncio
 
-from bson import ObjectId
-import httpx
-from dotenv import load_dotenv
-from rich import print
-
-from db_operations import MongoConnector
-
-load_dotenv()
-
-CUR_CONVERTER_KEY = os.getenv("CURRENCY_API_KEY")  
-CURRENCIES = {
-    "RUB": "₽",
-    "USD": "$",
-    "EUR": "€",
-    "KZT": "₸",
-    "AZN": "₼"
-}
+from currency_rates import rates_provider
+from salary import parse_salary, convert_currency, NO_NUMBERS  # noqa: F401
+from migrations import run_migration, salary_bounds, salary_currency, rename_key
 
 async def get_currency_rates():
-    async with httpx.AsyncClient() as client:
-        url = "https://api.freecurrencyapi.com/v1/latest"
-        
-        params = {
-            "apikey" : CUR_CONVERTER_KEY,
-            "base_currency" : "RUB",
-            "currencies" : "RUB,USD,EUR"
-        }
-        response = await client.get(url, params=params)
-        currency_rates = response.json()["data"]
-        print(currency_rates)
+    return await rates_provider.load()
 
-        return currency_rates
 
 def split_salary(salary_type, value, currency):
-    # 1. По договоренности - "no numbers"
-    # 2. Вилка "fork"
-    # 3. Одно число "fixed"
-    # 4. от "min"
-    # 5. до "max"
-
-    if salary_type == "no numbers":
+    """ min and max of salary string in its currency, salary_type and currency are detected by salary.parse_salary """
+    if salary_type == NO_NUMBERS:
         return None, None
-    
-    elif salary_type == "fork":
-        
-        salary_min, salary_max = value.replace(CURRENCIES[currency], "").split("–")
-        salary_min = int(salary_min.replace(" ", "").replace("на руки", ""))
-        salary_max = int(salary_max.replace(" ", "").replace("на руки", ""))
-        return salary_min, salary_max
-    
-    elif salary_type == "fixed":
-        print(value)
-        salary_min = int(value.replace(CURRENCIES[currency], "")
-                         .replace(" ", "")
-                         .replace("на руки", ""))
-        return salary_min, salary_min
-    
-    elif salary_type == "min":
-        salary_min = int(value.replace(CURRENCIES[currency], "")
-                         .replace("на руки", "")
-                         .replace(" ", "")
-                         .replace("от", ""))
-        return salary_min, None
 
-    elif salary_type == "max":
-        salary_max = int(value.replace(CURRENCIES[currency], "")
-                            .replace("на руки", "")
-                            .replace(" ", "")
-                            .replace("до", ""))
-        
-        return None, salary_max
+    parsed = parse_salary(value)
+    return parsed.min, parsed.max
 
 
 def detect_currency(value):
-    
-    if "₽" in value:
-        return "RUB"
-    elif "$" in value:
-        return "USD"
-    elif "€" in value:
-        return "EUR"
-    elif "₸" in value:
-        return "KZT"
-    elif "₼" in value:
-        return "AZN"
-    else:
-        print(value)
-        print("Can't detect currency")
-
-
-def convert_currency(currency, salary_min, 
-                     salary_max, rates):
-    
-    if currency == "KZT":
-        converted_min = round(salary_min / 5.1) if salary_min is not None else None
-        converted_max = round(salary_max / 5.1) if salary_max is not None else None
-        return converted_min, converted_max
-    
-    elif currency == "AZN":
-        converted_min = round(salary_min / 0.019) if salary_min is not None else None
-        converted_max = round(salary_max / 0.019) if salary_max is not None else None
-        return converted_min, converted_max
-
-    converted_min = round(salary_min / rates[currency]) if salary_min is not None else None
-    converted_max = round(salary_max / rates[currency]) if salary_max is not None else None
-
-    return converted_min, converted_max
+    return parse_salary(value).currency
 
 
 async def main():
-    db = MongoConnector()
-    rates = await get_currency_rates()
-    result = db.collection.find({})
-    counter = 4500
-    
-    async for item in result:
-        salary = item["salary"]
-        
-        currency = detect_currency(salary) if salary else "RUB"
-        salary_min, salary_max = split_salary(item["salary_type"], item["salary"], currency)
-        
-        if "salary_min" in item.keys():
-            print("Already updated")
-            continue
-
-        if currency != "RUB":
-            salary_min, salary_max = convert_currency(currency, salary_min, 
-                                                      salary_max, rates)
-        query = {"_id": ObjectId(item["_id"])}
-        
-        new_fields = {
-            "salary_min": salary_min,
-            "salary_max": salary_max
-        }
-
-        await db.collection.update_one(query, {"$set": new_fields})
-        counter += 1
-        print(f"Items updated: {counter}")    
-
-
-    await db.close_connection()
+    """ salary_min and salary_max for documents stored before they were parsed """
+    return await run_migration(salary_bounds())
 
 
 async def update_key(old_key, new_key):
-    db = MongoConnector()
-    await db.collection.update_many({}, {"$rename": {old_key: new_key}})
-    await db.close_connection()
+    return await run_migration(rename_key(old_key, new_key))
 
 
 async def set_currency():
-    db = MongoConnector()
-    result = db.collection.find({"salary_currency": {"$exists": False}})
-    counter = 0
-
-    async for item in result:
-        query = {"_id": ObjectId(item["_id"])}
-        salary = item["salary"]
-        currency = detect_currency(salary) if salary else "RUB"
-        
-        await db.collection.update_one(query, {"$set": {"salary_currency": currency}})
-        counter += 1
-        print(f"Items updated: {counter}")  
-    # async for item in result:
-    #     item["key_skills"]    
-    #     for skill in item["key_skills"]:
-    #         skills_list.add(skill)
-
-    
+    return await run_migration(salary_currency())
 
-    await db.close_connection()
 
 if __name__ == "__main__":
     asyncio.run(set_currency())
@@ -1,145 +1,77 @@
 import asyncio
 import logging
+from datetime import datetime
 
-from bson import ObjectId
 from rich import print
 from rich.logging import RichHandler
 from aiolimiter import AsyncLimiter
 
 from html_scraper import get_html
-from selectolax.parser import Selector, HTMLParser
 from models import VacancyRAW
-from db_operations import MongoConnector
+from db_operations import MongoConnector, BulkVacancyWriter
+from parse_executor import parse_executor
+# detail parsers live in parsers, they are importable without the network stack
+from parsers import (parse_description, parse_key_skills, parse_company_address, parse_company_rating,  # noqa: F401
+                     parse_company_reviews, parse_company_recommendations, parse_employment_type,
+                     parse_vacancy_details)
 
-def parse_description(html: Selector) -> str:
-    """Parse vacancy description from html"""
-    description_selector = html.css_first("div[data-qa='vacancy-description']")
 
-    if description_selector:
-        description = description_selector.text()
-        return description
+async def scrape_additional_data(item: VacancyRAW, limiter: AsyncLimiter):
+    html = await get_html(item.url, "httpx", limiter, page_kind="vacancy")
     
-    else:
-        logging.info("No description found")
+    if not html:
         return None
 
+    details = await parse_executor.vacancy_details(html)
 
-def parse_key_skills(html: Selector) -> list:
-    skills_selector = html.css("span[data-qa='bloko-tag__text']")
-    key_skills = list()
-
-    if skills_selector:
-        for skill in skills_selector:
-            key_skills.append(skill.text())
+    item.description = details["description"]
+    item.key_skills = details["key_skills"]
+    item.extracted_skills = details["extracted_skills"]
+    item.company_address = details["company_address"]
+    item.employment_type = details["employment_type"]
 
-    return key_skills
+    return item
 
 
-def parse_company_address(html: Selector) -> str:
-    address_selector_one = html.css_first("span[data-qa='vacancy-view-raw-address']")
-    address_selector_two = html.css_first("p[data-qa='vacancy-view-location']")
+async def filter_new_items(items: list, db_connector: MongoConnector,
+                           known_ids: set = None, writer: BulkVacancyWriter = None):
+    """
+    Split items of one SERP page into already stored, pending and new ones.
+    Stored items are updated with one bulk query, new ones are returned.
+    Pending items are found by another search word and are not written yet,
+    they get this search string too and are not fetched again.
+    If `known_ids` are loaded at the start of the run, db isn't queried at all,
+    returned ids are added to them.
+    """
+    # the same vacancy can be twice on a page
+    items = list({item.source_id: item for item in items if item}.values())
 
-    if address_selector_one:
-        address = address_selector_one.text()
-        return address
+    if not items:
+        return []
     
-    if address_selector_two:
-        address = address_selector_two.text()
-        return address
-    
-    else:
-        logging.info("No address found")
-        return None
-
+    search_string = items[0].search_strings[0]
+    pending_ids = writer.merge_pending([item.source_id for item in items], search_string) if writer else set()
+    ids = [item.source_id for item in items if item.source_id not in pending_ids]
 
-def parse_company_rating(html: Selector) -> float:
-    rating_selector = html.css_first("span[data-qa='employer-rating']")
-
-    if rating_selector:
-        rating = rating_selector.text()
-        return float(rating)
-    
+    if known_ids is not None:
+        stored_ids = known_ids.intersection(ids)
     else:
-        logging.info("No rating found")
-        return None
+        stored_ids = await db_connector.find_known_ids(ids)
 
+    if stored_ids:
+        logging.info(f"{len(stored_ids)} items are already in db")
+        await db_connector.mark_seen(stored_ids, search_string)
 
-def parse_company_reviews(html: Selector) -> int:
-    reviews_selector = html.css_first("a[data-qa='vacancy-company-reviews-count']")
+    new_items = [item for item in items if item.source_id not in stored_ids and item.source_id not in pending_ids]
 
-    if reviews_selector:
-        reviews = reviews_selector.text()
-        return int(reviews)
-    
-    else:
-        logging.info("No reviews found")
-        return None
-    
+    if known_ids is not None:
+        known_ids.update(item.source_id for item in new_items)
 
-def parse_company_recommendations(html: Selector) -> int:
-    recommendations_selector = html.css_first("a[data-qa='vacancy-company-reviews-recommendations']")
+    if writer:
+        writer.claim(new_items)
 
-    if recommendations_selector:
-        recommendations = recommendations_selector.text()
-        return int(recommendations)
-    
-    else:
-        logging.info("No recommendations found")
-        return None
-
-
-def parse_employment_type(html: Selector) -> str:
-    employment_type_selector = html.css_first("p[data-qa='vacancy-view-employment-mode']")
-
-    if employment_type_selector:
-        employment_type = employment_type_selector.text()
-        return employment_type
-    
-    else:
-        logging.info("No employment type found")
-        return None
+    return new_items
 
-async def scrape_additional_data(item: VacancyRAW, db_connector: MongoConnector, 
-                                 limiter: AsyncLimiter):
-    # first check in db
-    # if It's not in db, then use scraping
-    # if it is, just copy data from db
-    db_item = await db_connector.find_item_by_id(item.source_id)
-
-    if db_item:
-        logging.info("Item is already in db")
-        query = {"_id": ObjectId(db_item["_id"])}
-
-        if isinstance(db_item["search_strings"], list):
-            if item.search_strings[0] not in db_item["search_strings"]:
-                new_word_list = db_item["search_strings"] + item.search_strings
-                await db_connector.collection.update_one(query, {"$set": {"search_strings": new_word_list}})
-
-        elif isinstance(db_item["search_strings"], str):
-            if item.search_strings[0] != db_item["search_strings"]:
-                new_word_list = [db_item["search_strings"]] + item.search_strings
-                await db_connector.collection.update_one(query, {"$set": {"search_strings": new_word_list}})
-
-        await db_connector.set_is_actual_true(item.source_id)
-        return None
-    
-    else:
-        html = await get_html(item.url, "httpx", limiter)
-        
-        if html:
-            selectolax = HTMLParser(html)
-        
-        else:
-            return None
-
-        item.description = parse_description(selectolax)
-        item.key_skills = parse_key_skills(selectolax)
-        item.company_address = parse_company_address(selectolax)
-        
-        item.employment_type = parse_employment_type(selectolax)
-
-        return item
-        
 
 if __name__ == "__main__":
     
@@ -153,18 +85,22 @@ if __name__ == "__main__":
         salary=None,
         url='https://hh.ru/vacancy/91586327',
         city='Москва',
-        experience=[3, 6],
+        experience_min=3,
+        experience_max=6,
         fresh=False,
         is_actual=True,
         company_name='ООО Ок Софт',
         company_page='https://hh.ru/employer/5692713?hhtmFrom=vacancy_search_list',
-        search_string='python',
-        when_scraped='15-01-2024 04:01:44',
+        search_strings=['python'],
+        when_scraped=datetime(2024, 1, 15, 4, 1, 44),
         company_address=None,
         description=None,
         employment_type=None,
         source_id='91535831',
-        key_skills=None
+        key_skills=None,
+        is_scraped=None,
+        is_archived=False,
+        responded=False
     )
 
     limiter = AsyncLimiter(10, 1)